@@ -0,0 +1,93 @@
+"""
+Benchmark `Manifest.read_fields` against `json.load` on synthetic extension manifests.
+
+Usage: python benchmarks/bench_manifest.py [--sizes 0.1,1,5,20] [--repeat 5]
+
+Sizes are in MB of `contributes` data. Reports the best wall time and the
+peak traced memory of each parser.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.manifest import Manifest  # noqa: E402
+from modules.vscode import VSCode  # noqa: E402
+
+
+def make_manifest(file_path: str, size_mb: float) -> None:
+    """Write a manifest whose `contributes` section is about `size_mb` MB, placed before most wanted fields."""
+    commands = []
+    approx_size = 0
+    index = 0
+    while approx_size < size_mb * 1024 * 1024:
+        command = {
+            "command": f"synthetic.command{index}",
+            "title": f"Synthetic command {index} with a \"quoted\" {{brace}} title",
+            "category": "Synthetic",
+            "enablement": "editorFocus && !inDebugMode",
+        }
+        commands.append(command)
+        approx_size += 160
+        index += 1
+    manifest = {
+        "name": "synthetic",
+        "contributes": {"commands": commands, "menus": {"commandPalette": commands[:100]}},
+        "publisher": "bench",
+        "version": "1.2.3",
+        "description": "Synthetic manifest",
+        "repository": {"type": "git", "url": "https://example.com/synthetic.git"},
+        "categories": ["Other"],
+    }
+    with open(file_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def json_load(file_path: str) -> dict:
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
+        data = json.load(file)
+    return {key: data[key] for key in VSCode.MANIFEST_FIELDS if key in data}
+
+
+def streaming(file_path: str) -> dict:
+    return Manifest.read_fields(file_path, VSCode.MANIFEST_FIELDS)
+
+
+def measure(parse, file_path: str, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(file_path)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    parse(file_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="0.1,1,5,20", help="comma separated contributes sizes in MB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'parser':>10} {'time (ms)':>10} {'peak (KB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (float(value) for value in args.sizes.split(",")):
+            file_path = os.path.join(directory, "package.json")
+            make_manifest(file_path, size)
+            assert json_load(file_path) == streaming(file_path)
+            label = f"{os.path.getsize(file_path) / 1024 / 1024:.1f}MB"
+            for name, parse in (("json.load", json_load), ("streaming", streaming)):
+                best, peak = measure(parse, file_path, args.repeat)
+                print(f"{label:>8} {name:>10} {best * 1000:>10.1f} {peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Track CLI startup cost per subcommand with `python -X importtime`.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--top 5]
+
+Each command runs in a fresh interpreter against the local GitHub fake, in a
+throwaway HOME and working directory. Reports the best wall time, the total
+import time and the slowest top-level imports of each command.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_sync import make_home  # noqa: E402
+from fake_github import FakeGitHub  # noqa: E402
+
+# (label, arguments); the same working directory is reused, so the second
+# sync-send runs against an up-to-date manifest
+SCENARIOS = [
+    ("--help (fire)", ["--help"]),
+    ("sync-send", ["sync-send"]),
+    ("sync-send (unchanged)", ["sync-send"]),
+    ("sync-get", ["sync-get"]),
+]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> tuple:
+    """Return the total import time in microseconds and `[(cumulative, module)]` of top-level imports."""
+    top_level = []
+    for match in IMPORT_LINE.finditer(stderr):
+        if len(match.group(3)) == 1:
+            top_level.append((int(match.group(2)), match.group(4)))
+    return sum(cumulative for cumulative, _ in top_level), sorted(top_level, reverse=True)
+
+
+def run(args: list, env: dict, cwd: str) -> tuple:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), *args],
+        env=env, cwd=cwd, capture_output=True, text=True,
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    fake = FakeGitHub().start()
+    try:
+        for label, command in SCENARIOS:
+            best_wall, best_imports, slowest = float("inf"), float("inf"), []
+            for _ in range(args.runs):
+                with tempfile.TemporaryDirectory() as root:
+                    home = os.path.join(root, "home")
+                    make_home(home, 10, 4)
+                    env = dict(os.environ, HOME=home, SS_API_URL=fake.url, PATH="")
+                    with open(os.path.join(root, ".env"), "w") as env_file:
+                        env_file.write("GH_TOKEN=bench\n")
+                    if label == "sync-send (unchanged)":
+                        run(command, env, root)
+                    wall, stderr = run(command, env, root)
+                total, top_level = parse_importtime(stderr)
+                best_wall = min(best_wall, wall)
+                if total < best_imports:
+                    best_imports, slowest = total, top_level[:args.top]
+            print(f"{label:<24} wall {best_wall * 1000:7.1f} ms   imports {best_imports / 1000:7.1f} ms")
+            for cumulative, module in slowest:
+                print(f"{'':<26}{module:<32} {cumulative / 1000:7.1f} ms")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark `ss sync-send` and `ss sync-get` against a local fake of the GitHub API.
+
+Usage: python benchmarks/bench_sync.py [--extensions 80] [--settings-kb 16] [--latency-ms 50]
+                                        [--rate-limit 5000] [--rate-window 3600] [--runs 1]
+
+Every scenario runs in a throwaway HOME and working directory. For each step it
+reports wall time, HTTP requests and bytes seen by the fake server, and the peak
+memory traced in this process. Extension installs need a `code` binary on PATH;
+without one that step only reports the missing command.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub  # noqa: E402
+from main import CLICommands  # noqa: E402
+from modules.client import Client  # noqa: E402
+from modules.scheduler import Scheduler  # noqa: E402
+
+
+def make_home(home: str, extensions: int, settings_kb: int) -> None:
+    """Populate a fake home folder with VSCode settings, keybindings and extensions."""
+    user_folder = os.path.join(home, ".config", "Code", "User")
+    os.makedirs(user_folder)
+    os.makedirs(os.path.join(home, "Desktop"))
+    settings = {}
+    index = 0
+    while len(json.dumps(settings)) < settings_kb * 1024:
+        settings[f"bench.setting{index}"] = f"value {index}"
+        index += 1
+    with open(os.path.join(user_folder, "settings.json"), "w") as file:
+        json.dump(settings, file, indent=4)
+    with open(os.path.join(user_folder, "keybindings.json"), "w") as file:
+        json.dump([{"key": f"ctrl+{i}", "command": f"bench.command{i}"} for i in range(20)], file, indent=4)
+    for i in range(extensions):
+        extension_path = os.path.join(home, ".vscode", "extensions", f"bench.extension{i}-1.0.{i}")
+        os.makedirs(extension_path)
+        with open(os.path.join(extension_path, "package.json"), "w") as file:
+            json.dump({
+                "name": f"extension{i}",
+                "publisher": "bench",
+                "version": f"1.0.{i}",
+                "description": "Benchmark extension",
+                "categories": ["Other"],
+                "contributes": {"commands": [{"command": f"bench.extension{i}.c{j}", "title": "x"} for j in range(50)]},
+            }, file)
+
+
+def run_step(fake: FakeGitHub, name: str, command) -> dict:
+    """Run one CLI command and collect its numbers."""
+    fake.reset_counters()
+    for key in Scheduler.stats:
+        Scheduler.stats[key] = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        command()
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "step": name,
+        "wall_ms": round(wall * 1000, 1),
+        "requests": fake.request_count,
+        "bytes_in": fake.bytes_in,
+        "bytes_out": fake.bytes_out,
+        "peak_kb": round(peak / 1024),
+        "retries": Scheduler.stats["retries"],
+        "throttled_s": round(Scheduler.stats["throttled_seconds"], 2),
+        "endpoints": dict(sorted(fake.requests.items())),
+    }
+
+
+def run_scenario(args) -> list:
+    fake = FakeGitHub(latency=args.latency_ms / 1000, rate_limit=args.rate_limit, rate_window=args.rate_window).start()
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        try:
+            sender_home = os.path.join(root, "sender")
+            receiver_home = os.path.join(root, "receiver")
+            make_home(sender_home, args.extensions, args.settings_kb)
+            os.makedirs(os.path.join(receiver_home, ".config", "Code", "User"))
+            os.makedirs(os.path.join(receiver_home, "Desktop"))
+
+            Client.API_URL = fake.url
+            Scheduler.remaining = Scheduler.reset = None
+            Scheduler.retry_after_until = 0.0
+            Scheduler.budget = Scheduler.RETRY_BUDGET
+            os.chdir(root)
+            with open(".env", "w") as env_file:
+                env_file.write("GH_TOKEN=bench\n")
+
+            cli = CLICommands()
+            os.environ["HOME"] = sender_home
+            results.append(run_step(fake, "sync-send (first)", cli.sync_send))
+            results.append(run_step(fake, "sync-send (unchanged)", cli.sync_send))
+            os.environ["HOME"] = receiver_home
+            results.append(run_step(fake, "sync-get (first)", cli.sync_get))
+            results.append(run_step(fake, "sync-get (unchanged)", cli.sync_get))
+        finally:
+            os.chdir(cwd)
+            fake.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--extensions", type=int, default=80)
+    parser.add_argument("--settings-kb", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--rate-window", type=float, default=3600)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    home = os.environ.get("HOME")
+    try:
+        for run in range(args.runs):
+            results = run_scenario(args)
+            if args.json:
+                print(json.dumps(results, indent=2))
+                continue
+            print(f"run {run + 1}: {args.extensions} extensions, {args.settings_kb} KB settings, {args.latency_ms:g} ms latency")
+            print(f"{'step':<24} {'wall (ms)':>10} {'requests':>9} {'bytes in':>10} {'bytes out':>10} {'peak (KB)':>10} {'retries':>8}")
+            for result in results:
+                print(
+                    f"{result['step']:<24} {result['wall_ms']:>10} {result['requests']:>9} {result['bytes_in']:>10}"
+                    f" {result['bytes_out']:>10} {result['peak_kb']:>10} {result['retries']:>8}"
+                )
+    finally:
+        if home is not None:
+            os.environ["HOME"] = home
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+A local stand-in for the parts of the GitHub REST API used by VSCode-Settings-Sync.
+
+Start it with `FakeGitHub(latency=..., rate_limit=...).start()` and point
+`Client.API_URL` at `fake.url`. Repositories are kept in memory as a small
+git object model, so blob SHAs match what real git would compute.
+"""
+import base64
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from modules.profiler import Profiler
+
+
+def blob_sha(content: bytes) -> str:
+    return hashlib.sha1(f"blob {len(content)}\0".encode("utf-8") + content).hexdigest()
+
+
+def object_sha(kind: str, data) -> str:
+    return hashlib.sha1(f"{kind}:{json.dumps(data, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+
+class Repo:
+    """An in-memory repository: blobs, flat trees ({path: blob sha}), commits and one branch."""
+
+    def __init__(self, branch: str = "main"):
+        self.branch = branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        tree = self.put_tree({"README.md": self.put_blob(b"# VSCode Settings\n")})
+        self.head = self.put_commit(tree, [], "Initial commit")
+
+    def put_blob(self, content: bytes) -> str:
+        sha = blob_sha(content)
+        self.blobs[sha] = content
+        return sha
+
+    def put_tree(self, entries: dict) -> str:
+        sha = object_sha("tree", entries)
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def put_commit(self, tree: str, parents: list, message: str) -> str:
+        sha = object_sha("commit", {"tree": tree, "parents": parents, "message": message, "time": time.time()})
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def files(self) -> dict:
+        return self.trees[self.commits[self.head]["tree"]]
+
+
+class FakeGitHub:
+    """
+    Threaded HTTP server implementing /user, /user/repos, /repos/... contents, branches and Git Data endpoints.
+
+    `latency` is added to every response in seconds. `rate_limit` requests are allowed per
+    `rate_window` seconds, after which requests get a 403 with exhausted rate-limit headers.
+    """
+
+    def __init__(self, login: str = "bench", latency: float = 0.0, rate_limit: int = 5000, rate_window: float = 3600):
+        self.login = login
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.repos = {}
+        self.lock = threading.Lock()
+        self.reset_counters()
+        self.server = None
+
+    def reset_counters(self) -> None:
+        self.requests = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.window_start = time.time()
+        self.window_used = 0
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> "FakeGitHub":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def handle_method(self):
+                fake.handle(self)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_method
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Request plumbing
+
+    def read_body(self, handler) -> bytes:
+        if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(handler.rfile.readline().strip(), 16)
+                if size == 0:
+                    handler.rfile.readline()
+                    return body
+                body += handler.rfile.read(size)
+                handler.rfile.readline()
+        return handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+
+    def send(self, handler, status: int, data=None, raw: bytes = None, headers: dict = None) -> None:
+        body = raw if raw is not None else (json.dumps(data).encode("utf-8") if data is not None else b"")
+        handler.send_response(status)
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.send_header("X-RateLimit-Limit", str(self.rate_limit))
+        handler.send_header("X-RateLimit-Remaining", str(max(self.rate_limit - self.window_used, 0)))
+        handler.send_header("X-RateLimit-Reset", str(math.ceil(self.window_start + self.rate_window)))
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(body)
+        with self.lock:
+            self.bytes_out += len(body)
+
+    def handle(self, handler) -> None:
+        body = self.read_body(handler)
+        url = urlparse(handler.path)
+        with self.lock:
+            label = Profiler.endpoint(handler.command, url.path)
+            self.requests[label] = self.requests.get(label, 0) + 1
+            self.bytes_in += len(body)
+            if time.time() - self.window_start >= self.rate_window:
+                self.window_start = time.time()
+                self.window_used = 0
+            self.window_used += 1
+            limited = self.window_used > self.rate_limit
+        if self.latency:
+            time.sleep(self.latency)
+        if limited:
+            return self.send(handler, 403, {"message": "API rate limit exceeded"})
+        try:
+            payload = json.loads(body) if body else {}
+            self.route(handler, handler.command, url.path, payload)
+        except Exception as e:  # Keep the server alive and report the failure to the client
+            self.send(handler, 500, {"message": f"{type(e).__name__}: {e}"})
+
+    # Endpoints
+
+    def route(self, handler, method: str, path: str, payload: dict) -> None:
+        if path == "/user" and method == "GET":
+            return self.send(handler, 200, {"login": self.login})
+        if path == "/user/repos" and method == "POST":
+            name = payload["name"]
+            if name in self.repos:
+                return self.send(handler, 422, {"message": "Repository creation failed."})
+            self.repos[name] = Repo()
+            return self.send(handler, 201, {"name": name, "default_branch": self.repos[name].branch})
+
+        match = re.match(r"^/repos/([^/]+)/([^/]+)(/.*)?$", path)
+        if match is None or match.group(2) not in self.repos:
+            return self.send(handler, 404, {"message": "Not Found"})
+        repo = self.repos[match.group(2)]
+        rest = match.group(3) or ""
+        raw = "raw" in handler.headers.get("Accept", "")
+
+        if rest == "" and method == "GET":
+            return self.send(handler, 200, {"name": match.group(2), "default_branch": repo.branch})
+        if rest == f"/branches/{repo.branch}" and method == "GET":
+            commit = repo.commits[repo.head]
+            return self.send(handler, 200, {
+                "name": repo.branch,
+                "commit": {"sha": repo.head, "commit": {"tree": {"sha": commit["tree"]}}},
+            })
+        if rest == f"/git/ref/heads/{repo.branch}" and method == "GET":
+            return self.send(handler, 200, {"object": {"sha": repo.head, "type": "commit"}})
+        if rest == f"/git/refs/heads/{repo.branch}" and method == "PATCH":
+            repo.head = payload["sha"]
+            return self.send(handler, 200, {"object": {"sha": repo.head, "type": "commit"}})
+        if rest == "/git/blobs" and method == "POST":
+            content = base64.b64decode(payload["content"]) if payload.get("encoding") == "base64" else payload["content"].encode("utf-8")
+            return self.send(handler, 201, {"sha": repo.put_blob(content)})
+        if rest.startswith("/git/blobs/") and method == "GET":
+            content = repo.blobs[rest.rsplit("/", 1)[1]]
+            if raw:
+                return self.send(handler, 200, raw=content)
+            return self.send(handler, 200, {"content": base64.b64encode(content).decode("utf-8"), "encoding": "base64", "size": len(content)})
+        if rest == "/git/trees" and method == "POST":
+            entries = dict(repo.trees[payload["base_tree"]]) if payload.get("base_tree") else {}
+            for entry in payload["tree"]:
+                if "content" in entry:
+                    entries[entry["path"]] = repo.put_blob(entry["content"].encode("utf-8"))
+                elif entry.get("sha") is None:
+                    entries.pop(entry["path"], None)
+                else:
+                    entries[entry["path"]] = entry["sha"]
+            return self.send(handler, 201, {"sha": repo.put_tree(entries)})
+        if rest.startswith("/git/trees/") and method == "GET":
+            tree_ish = rest.rsplit("/", 1)[1]
+            if tree_ish == repo.branch:
+                tree_ish = repo.commits[repo.head]["tree"]
+            entries = repo.trees[tree_ish]
+            etag = f'"{tree_ish}"'
+            if handler.headers.get("If-None-Match") == etag:
+                return self.send(handler, 304, headers={"ETag": etag})
+            return self.send(handler, 200, {"sha": tree_ish, "truncated": False, "tree": [
+                {"path": path, "mode": "100644", "type": "blob", "sha": sha, "size": len(repo.blobs[sha])}
+                for path, sha in sorted(entries.items())
+            ]}, headers={"ETag": etag})
+        if rest == "/git/commits" and method == "POST":
+            sha = repo.put_commit(payload["tree"], payload.get("parents", []), payload.get("message", ""))
+            return self.send(handler, 201, {"sha": sha})
+        if rest.startswith("/contents/"):
+            file_path = rest[len("/contents/"):]
+            files = repo.files()
+            if method == "GET":
+                if file_path not in files:
+                    return self.send(handler, 404, {"message": "Not Found"})
+                sha = files[file_path]
+                etag = f'"{sha}"'
+                if handler.headers.get("If-None-Match") == etag:
+                    return self.send(handler, 304, headers={"ETag": etag})
+                content = repo.blobs[sha]
+                if raw:
+                    return self.send(handler, 200, raw=content, headers={"ETag": etag})
+                return self.send(handler, 200, {
+                    "path": file_path, "sha": sha, "size": len(content), "encoding": "base64",
+                    "content": base64.b64encode(content).decode("utf-8"),
+                }, headers={"ETag": etag})
+            if method == "PUT":
+                if file_path in files and payload.get("sha") != files[file_path]:
+                    return self.send(handler, 409, {"message": "sha does not match"})
+                entries = dict(files)
+                entries[file_path] = repo.put_blob(base64.b64decode(payload["content"]))
+                repo.head = repo.put_commit(repo.put_tree(entries), [repo.head], payload.get("message", ""))
+                return self.send(handler, 200 if file_path in files else 201, {"content": {"sha": entries[file_path]}})
+        return self.send(handler, 404, {"message": "Not Found"})
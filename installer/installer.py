@@ -1,110 +1,310 @@
 import os
 import platform
+import re
+import shutil
+import stat
 import subprocess
+import tarfile
 import threading
-import tkinter as tk
-from tkinter import ttk
+import urllib.error
+import urllib.request
 
-from ttkbootstrap import Style
+# Where the CLI is installed from, overridable (e.g. with a local repository or file server for testing)
+GITHUB_REPO = os.environ.get("SS_INSTALL_REPO", "https://github.com/RyanBaig/VSCode-Settings-Sync.git")
+BRANCH = os.environ.get("SS_INSTALL_BRANCH", "main")
+TARBALL_URL = os.environ.get(
+    "SS_INSTALL_TARBALL", f"https://codeload.github.com/RyanBaig/VSCode-Settings-Sync/tar.gz/refs/heads/{BRANCH}"
+)
+INSTALL_DIR = os.environ.get("SS_INSTALL_DIR", os.path.join(os.path.expanduser("~"), "VSCode-Settings-Sync"))
 
+# git progress lines, e.g. "Receiving objects:  45% (9/20), 1.20 MiB | 2.00 MiB/s"
+GIT_PROGRESS = re.compile(r"([A-Z][a-z]+ [a-z]+):\s+(\d+)% \((\d+)/(\d+)\)(?:, ([\d.]+) ([KMG]i)?B)?")
+UNITS = {None: 1, "Ki": 1024, "Mi": 1024 ** 2, "Gi": 1024 ** 3}
 
-# Function to perform installation
-def install_vscss():
-    # Define the GitHub repository and installation directory
-    github_repo = "https://github.com/RyanBaig/VSCode-Settings-Sync.git"
-    install_dir = os.path.join(os.path.expanduser("~"), "VSCode-Settings-Sync")
 
-    try:
-        # Check if the installation directory already exists; if it does, remove it
+def remove_tree(path):
+    """Remove a folder, including the read-only files git leaves on Windows."""
+    def make_writable(function, failed_path, _):
+        os.chmod(failed_path, stat.S_IWRITE)
+        function(failed_path)
+
+    if os.path.exists(path):
+        shutil.rmtree(path, onerror=make_writable)
+
+
+def recover(install_dir):
+    """Undo a swap that was interrupted after moving the old installation aside."""
+    backup_dir = install_dir + ".old"
+    if os.path.exists(backup_dir):
         if os.path.exists(install_dir):
-            status_label.config(text="Removing existing installation directory.")
-            if platform.system() == "Windows":
-                subprocess.call(["rmdir", "/s", "/q", install_dir], shell=True)
-            else:
-                subprocess.call(["rm", "-rf", install_dir])
-
-        # Update the status label and start the progress bar
-        status_label.config(text="Cloning the repository into TerminalTools directory.")
-        progress["value"] = 0  # Reset progress bar to 0
-        progress.start()
-
-        # Clone the GitHub repository into the installation directory
-        subprocess.call(["git", "clone", github_repo, install_dir])
-
-        # Stop the progress bar
-        progress.stop()
-
-        # Add installation directory to PATH if on Windows
-        if platform.system() == "Windows":
-            path_env = os.environ["PATH"]
-            path_env += os.pathsep + install_dir
-            os.environ["PATH"] = path_env
-            # Save the changes to the PATH environment variable
-            os.system('setx PATH "{}"'.format(path_env))
-
-        elif platform.system() == "Linux":
-            # Get the current value of PATH
-            directory = install_dir
-            current_path = os.environ.get("PATH", "")
-
-            # Add the directory to PATH if it's not already there
-            if directory not in current_path.split(os.pathsep):
-                os.environ["PATH"] = f"{directory}{os.pathsep}{current_path}"
-
-            # Save the updated PATH in the user's shell configuration file
-            with open(os.path.expanduser("~/.bashrc"), "a") as file:
-                file.write(
-                    f"\n# Added by VSCode-Settings-Sync Installer\nexport PATH={directory}:${{PATH}}\n"
-                )
-
-        status_label.config(
-            text="VSCode-Settings-Sync has been installed and added to the PATH."
+            remove_tree(backup_dir)
+        else:
+            os.rename(backup_dir, install_dir)
+
+
+def swap_in(staging_dir, install_dir):
+    """Replace the installation with the staged one, so it is never left half-written."""
+    backup_dir = install_dir + ".old"
+    if os.path.exists(install_dir):
+        os.rename(install_dir, backup_dir)
+    os.rename(staging_dir, install_dir)
+    remove_tree(backup_dir)
+
+
+def run_git(command, on_progress):
+    """
+    Run a git command, passing its progress to `on_progress(phase, percent, transferred bytes, total bytes)`.
+
+    git only knows the share of objects received, not the total size, so the total is always 0.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    output, line = [], b""
+    # git redraws progress lines with carriage returns
+    for char in iter(lambda: process.stderr.read(1), b""):
+        if char not in (b"\r", b"\n"):
+            line += char
+            continue
+        text = line.decode("utf-8", "replace")
+        line = b""
+        output.append(text)
+        match = GIT_PROGRESS.search(text)
+        if match:
+            phase, percent = match.group(1), int(match.group(2))
+            transferred = int(float(match.group(5)) * UNITS[match.group(6)]) if match.group(5) else 0
+            on_progress(phase, percent, transferred, 0)
+    if process.wait() != 0:
+        raise RuntimeError(output[-1] if output else f"{command[1]} failed")
+
+
+def fetch_with_git(repo_url, branch, install_dir, staging_dir, on_progress):
+    """
+    Stage a checkout of `branch`. An existing installation is updated incrementally,
+    only the new commits are fetched into it and the staging copy is cloned from it locally.
+    """
+    if os.path.isdir(os.path.join(install_dir, ".git")):
+        run_git(
+            ["git", "-C", install_dir, "fetch", "--progress", "--depth=1", "--update-head-ok",
+             repo_url, f"+refs/heads/{branch}:refs/heads/{branch}"],
+            on_progress,
         )
-        progress["value"] = (
-            100  # Set the progress bar to 100% when installation is complete
+        # Local copy, no network involved
+        run_git(
+            ["git", "clone", "--progress", "--branch", branch, install_dir, staging_dir],
+            lambda phase, *progress: on_progress(f"Staging ({phase.lower()})", *progress),
         )
-        if platform.system() == "Linux":
-            os.chmod(os.path.join(install_dir, "ss.sh"), 0o775)
+        subprocess.run(["git", "-C", staging_dir, "remote", "set-url", "origin", repo_url], check=True)
+    else:
+        run_git(
+            ["git", "clone", "--progress", "--depth=1", "--single-branch", "--branch", branch, repo_url, staging_dir],
+            on_progress,
+        )
+
+
+def fetch_tarball(tarball_url, install_dir, staging_dir, on_progress):
+    """
+    Download and unpack a source tarball into the staging folder.
+    An interrupted download is resumed where it stopped, unless the tarball changed since.
+    """
+    part_path = install_dir + ".tar.gz.part"
+    validator_path = part_path + ".etag"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset and os.path.exists(validator_path):
+        with open(validator_path) as file:
+            validator = file.read().strip()
+    # Without a validator the partial file may belong to an older tarball, so it is not resumed
+    if not validator:
+        offset = 0
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(tarball_url, headers=headers), timeout=60) as response:
+            if response.status != 206:
+                # The server does not support resuming or the tarball changed, start over
+                offset = 0
+                validator = response.headers.get("ETag")
+                if not validator or validator.startswith("W/"):
+                    # Weak ETags cannot be used in If-Range
+                    validator = response.headers.get("Last-Modified")
+                if validator:
+                    with open(validator_path, "w") as file:
+                        file.write(validator)
+                elif os.path.exists(validator_path):
+                    os.remove(validator_path)
+            length = int(response.headers.get("Content-Length") or 0)
+            total = offset + length if length else 0
+            with open(part_path, "ab" if offset else "wb") as file:
+                transferred = offset
+                for chunk in iter(lambda: response.read(64 * 1024), b""):
+                    file.write(chunk)
+                    transferred += len(chunk)
+                    on_progress("Downloading", transferred * 100 // total if total else 0, transferred, total)
+    except urllib.error.HTTPError as e:
+        # The same tarball (If-Range matched) has no bytes left to send:
+        # the download completed and only the unpack was interrupted
+        if e.code != 416:
+            raise
+
+    os.makedirs(staging_dir)
+    try:
+        with tarfile.open(part_path, "r:gz") as archive:
+            # GitHub tarballs wrap everything in a "<repo>-<branch>/" folder
+            members = []
+            for member in archive.getmembers():
+                name = member.name.split("/", 1)[1] if "/" in member.name else ""
+                if not name or name.startswith("/") or ".." in name.split("/") or member.issym() or member.islnk():
+                    continue
+                member.name = name
+                members.append(member)
+            archive.extractall(staging_dir, members=members)
+    except (tarfile.TarError, EOFError):
+        # A corrupt download is not resumed, the next attempt starts over
+        discard_download(part_path)
+        raise
+    discard_download(part_path)
+
+
+def discard_download(part_path):
+    """Remove a partial tarball download and its validator."""
+    for path in (part_path, part_path + ".etag"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def install(on_status, on_progress, repo_url=GITHUB_REPO, branch=BRANCH, tarball_url=TARBALL_URL, install_dir=INSTALL_DIR):
+    """
+    Install or update VSCode-Settings-Sync in `install_dir`.
+
+    The new version is staged next to the installation and swapped in once complete,
+    with git when it is available and from the source tarball otherwise.
+    """
+    staging_dir = install_dir + ".staging"
+    recover(install_dir)
+    remove_tree(staging_dir)
+    try:
+        if shutil.which("git"):
+            on_status("Fetching the repository with git.")
+            fetch_with_git(repo_url, branch, install_dir, staging_dir, on_progress)
         else:
-            pass
-    except Exception as e:
-        status_label.config(text=f"An error occurred: {str(e)}")
+            on_status("Downloading the source archive.")
+            fetch_tarball(tarball_url, install_dir, staging_dir, on_progress)
+    except BaseException:
+        remove_tree(staging_dir)
+        raise
+    swap_in(staging_dir, install_dir)
+    add_to_path(install_dir)
+    if platform.system() == "Linux":
+        os.chmod(os.path.join(install_dir, "ss.sh"), 0o775)
 
 
-def start_installation_thread():
-    install_button.configure(state="disabled")
-    installation_thread = threading.Thread(target=install_vscss)
-    installation_thread.start()
+def add_to_path(install_dir):
+    # Add installation directory to PATH if on Windows
+    if platform.system() == "Windows":
+        path_env = os.environ["PATH"]
+        if install_dir in path_env.split(os.pathsep):
+            return
+        path_env += os.pathsep + install_dir
+        os.environ["PATH"] = path_env
+        # Save the changes to the PATH environment variable
+        os.system('setx PATH "{}"'.format(path_env))
 
+    elif platform.system() == "Linux":
+        # Get the current value of PATH
+        directory = install_dir
+        current_path = os.environ.get("PATH", "")
 
-# Create the main window
-root = tk.Tk()
-root.title("VSCode-Settings-Sync Installer")
-root.geometry("500x200")
+        # Add the directory to PATH if it's not already there
+        if directory not in current_path.split(os.pathsep):
+            os.environ["PATH"] = f"{directory}{os.pathsep}{current_path}"
 
-# Use ttkbootstrap styles
-style = Style(theme="darkly")
-root.style = style
+        # Save the updated PATH in the user's shell configuration file, once
+        bashrc = os.path.expanduser("~/.bashrc")
+        line = f"export PATH={directory}:${{PATH}}"
+        if os.path.exists(bashrc):
+            with open(bashrc) as file:
+                if line in file.read():
+                    return
+        with open(bashrc, "a") as file:
+            file.write(f"\n# Added by VSCode-Settings-Sync Installer\n{line}\n")
 
-# Create a label
-label = ttk.Label(
-    root,
-    text="Click the 'Install' button to install VSCode-Settings-Sync",
-    font=("Helvetica", 15),
-)
-label.pack(pady=10)
 
-# Create the 'Install' button
-install_button = ttk.Button(root, text="Install", command=start_installation_thread)
-install_button.pack()
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def main():
+    import tkinter as tk
+    from tkinter import ttk
+
+    from ttkbootstrap import Style
+
+    # Widgets are only updated from the main loop, the installation runs in a thread
+    def set_status(text):
+        root.after(0, lambda: status_label.config(text=text))
+
+    def set_progress(phase, percent, transferred, total):
+        if total:
+            text = f"{phase}: {format_size(transferred)} of {format_size(total)}"
+        elif transferred and percent:
+            # git progress, the percentage counts objects and the total size is unknown
+            text = f"{phase}: {percent}% ({format_size(transferred)})"
+        elif transferred:
+            text = f"{phase}: {format_size(transferred)}"
+        else:
+            text = f"{phase}: {percent}%"
+        root.after(0, lambda: (progress.config(value=percent), status_label.config(text=text)))
+
+    # Function to perform installation
+    def install_vscss():
+        try:
+            install(set_status, set_progress)
+            set_status("VSCode-Settings-Sync has been installed and added to the PATH.")
+            root.after(0, lambda: progress.config(value=100))
+        except Exception as e:
+            set_status(f"An error occurred: {str(e)}")
+        root.after(0, lambda: install_button.configure(state="normal"))
+
+    def start_installation_thread():
+        install_button.configure(state="disabled")
+        progress["value"] = 0  # Reset progress bar to 0
+        installation_thread = threading.Thread(target=install_vscss, daemon=True)
+        installation_thread.start()
+
+    # Create the main window
+    root = tk.Tk()
+    root.title("VSCode-Settings-Sync Installer")
+    root.geometry("500x200")
+
+    # Use ttkbootstrap styles
+    style = Style(theme="darkly")
+    root.style = style
+
+    # Create a label
+    label = ttk.Label(
+        root,
+        text="Click the 'Install' button to install VSCode-Settings-Sync",
+        font=("Helvetica", 15),
+    )
+    label.pack(pady=10)
+
+    # Create the 'Install' button
+    install_button = ttk.Button(root, text="Install", command=start_installation_thread)
+    install_button.pack()
+
+    # Create a label to display installation status
+    status_label = ttk.Label(root, text="")
+    status_label.pack(pady=10)
+
+    # Create a progress bar
+    progress = ttk.Progressbar(root, mode="determinate", length=300)
+    progress.pack(pady=10)
 
-# Create a label to display installation status
-status_label = ttk.Label(root, text="")
-status_label.pack(pady=10)
+    # Start the GUI
+    root.mainloop()
 
-# Create a progress bar
-progress = ttk.Progressbar(root, mode="determinate", length=300)
-progress.pack(pady=10)
 
-# Start the GUI
-root.mainloop()
+if __name__ == "__main__":
+    main()
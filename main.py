@@ -1,15 +1,34 @@
 import os
+import sys
 from getpass import getpass
 
-import fire
-
-from modules.github import GitHub
+from modules.profiler import Profiler
 from modules.variables import Variables
-from modules.vscode import VSCode
 
 
+# Commands and global options handled without loading fire
+COMMANDS = ("login", "sync_send", "sync_get", "status", "watch", "stats")
+OPTIONS = ("profile", "trace")
+
+
+# Heavy dependencies (fire, requests and the GitHub/VSCode modules) are imported
+# by the commands that need them, so a command only pays for what it uses.
 class CLICommands:
+    def __init__(self, profile=None, trace=None):
+        """
+        Global options:
+            --profile[=FILE]  Print per-phase timings and HTTP calls per endpoint, and write a cProfile dump to FILE.
+            --trace=FILE      Write a Chrome trace timeline (chrome://tracing, Perfetto) of the command to FILE.
+        """
+        if profile or trace:
+            Profiler.start(
+                trace_path=trace,
+                profile_path=profile if isinstance(profile, str) else None,
+            )
+
     def login(self) -> str:
+        from modules.vscode import VSCode
+
         print("Welcome to VSCode-Settings-Sync!")
 
         if not os.path.exists(os.path.join( os.path.abspath("."), ".env" )):
@@ -37,6 +56,11 @@ class CLICommands:
 
                 if VSCode.validate_github_token(github_token):
                     print("Good News! The GitHub Token provided is valid! Token added to the database.")
+                    # A new token may belong to another account, so the cached login and repository are looked up again
+                    if Variables.get_var("GH_TOKEN") != github_token:
+                        from modules.client import Client
+
+                        Client.forget_identity()
                     # Add the token
                     Variables.put_var("GH_TOKEN", github_token)
                     break  # Exit the loop if a valid token is provided
@@ -48,17 +72,133 @@ class CLICommands:
         if attempts == max_attempts:
             print(f"Exceeded maximum attempts ({max_attempts}). Exiting.")
 
-    def sync_send(self):
-        create_repo_process = GitHub.create_repo()
-        if create_repo_process == 422:
-            print("Repository Already Created, Syncing...")
-        GitHub.send_files_to_repo()
+    def sync_send(self, bundle: bool = False):
+        """
+        Push the settings to the repository.
+            --bundle  Store them as one compressed archive plus an index (also enabled by SS_BUNDLE=true in .env).
+        """
+        from modules.github import GitHub
+        from modules.metrics import Metrics
+
+        bundle = bundle or Variables.get_var("SS_BUNDLE") == "true"
+
+        with Metrics.run("sync-send"), Profiler.phase("sync-send"):
+            with Profiler.phase("create_repo"):
+                create_repo_process = GitHub.create_repo()
+            if create_repo_process == 422:
+                print("Repository Already Created, Syncing...")
+            GitHub.send_files_to_repo(bundle=bundle)
+
+    def sync_get(self, homes=None, offline: bool = False):
+        """
+        Get the settings from the repository.
+            --homes=DIR,DIR  Apply them to these homes or VSCode data folders instead of yours, from one download.
+            --offline        Apply the last snapshot fetched into the local cache, without contacting GitHub.
+        """
+        from modules.github import GitHub
+        from modules.metrics import Metrics
+
+        if isinstance(homes, str):
+            homes = [home for home in homes.split(",") if home]
+
+        with Metrics.run("sync-get"), Profiler.phase("sync-get"):
+            if not offline:
+                with Profiler.phase("create_repo"):
+                    create_repo_process = GitHub.create_repo()
+                if create_repo_process == 422:
+                    print("Repository Already Created, Syncing...")
+            GitHub.get_files_from_repo(homes=homes, offline=offline)
+
+    def status(self):
+        """
+        Show which files differ between this machine and the repository.
+
+        Exits with 1 when any do and with 2 when the repository could not be reached.
+        """
+        from modules.github import GitHub
+        from modules.metrics import Metrics
+
+        with Metrics.run("status"), Profiler.phase("status"):
+            drifted = GitHub.status()
+        if drifted is None:
+            sys.exit(2)
+        if drifted:
+            sys.exit(1)
+
+    def stats(self, days: float = None):
+        """
+        Summarize the syncs recorded on this machine: failures, durations, API calls and rate-limit headroom.
+            --days=N  Only the syncs of the last N days.
+        """
+        from modules.metrics import Metrics
+
+        Metrics.summary(float(days) if days is not None else None)
+
+    def watch(self, debounce: float = 5.0):
+        """Watch VSCode's settings and extensions and push changes automatically."""
+        from modules.client import Client
+        from modules.scheduler import Scheduler
+        from modules.vscode import VSCode
+        from modules.watcher import Watcher
+
+        def push():
+            # The watcher runs for days, each push starts with a full retry budget and the current token
+            Scheduler.renew_budget()
+            Client.refresh_token()
+            self.sync_send()
+
+        # snippets/ and profiles/ are watched with their subfolders, so edits to e.g. profiles/<id>/settings.json are pushed
+        user_folder = VSCode.locate_user_folder()
+        watcher = Watcher(
+            {
+                user_folder: ("settings.json", "keybindings.json", "tasks.json"),
+                os.path.join(os.path.expanduser("~"), ".vscode", "extensions"): None,
+            },
+            callback=push,
+            debounce=float(debounce),
+            trees=[os.path.join(user_folder, folder) for folder in VSCode.USER_TREE_FOLDERS] if user_folder else [],
+            exclude=VSCode.is_excluded,
+        )
+        watcher.run()
+
+
+def parse_args(argv: list):
+    """
+    Parse `<command> [--profile[=FILE]] [--trace=FILE]` without loading fire.
+
+    Returns `(command, options)`, or None when the arguments need fire (help, unknown flags...).
+    """
+    if not argv or argv[0].replace("-", "_") not in COMMANDS:
+        return None
+    command = argv[0].replace("-", "_")
+    options = {}
+    args = iter(argv[1:])
+    for arg in args:
+        name, has_value, value = arg[2:].partition("=")
+        if not arg.startswith("--") or name not in OPTIONS:
+            return None
+        if not has_value:
+            # --trace needs a value, --profile may be used as a bare switch
+            value = next(args, None) if name == "trace" else True
+            if value is None:
+                return None
+        options[name] = value
+    return command, options
+
+
+def main(argv: list) -> None:
+    parsed = parse_args(argv)
+    try:
+        if parsed is not None:
+            command, options = parsed
+            getattr(CLICommands(**options), command)()
+        else:
+            import fire
+
+            fire.Fire(CLICommands, command=argv, name="ss")
+    finally:
+        Profiler.stop()
 
-    def sync_get(self):
-        create_repo_process = GitHub.create_repo()
-        if create_repo_process == 422:
-            print("Repository Already Created, Syncing...")
-        GitHub.get_files_from_repo()
 
 if __name__ == "__main__":
-    fire.Fire(CLICommands, name="ss")
+    main(sys.argv[1:])
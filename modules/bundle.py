@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import zipfile
+from modules.files import Files
+
+
+class Bundle:
+    """
+    Base class for the single-bundle snapshot format.
+
+    A snapshot is stored as two files in the repository:
+    - `bundle.zip`, a deterministic deflate-compressed archive of every synced file, and
+    - `bundle-index.json`, a small index with the blob SHA and size of each entry.
+
+    The index is enough to tell which entries differ locally, and the archive's
+    central directory lets those entries be extracted without unpacking the rest.
+    """
+    VERSION = 1
+    ARCHIVE_NAME = "bundle.zip"
+    INDEX_NAME = "bundle-index.json"
+    NAMES = (ARCHIVE_NAME, INDEX_NAME)
+    # Fixed timestamp so the same content always produces the same archive (and blob SHA)
+    DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+    def build(files: dict, shas: dict, directory: str) -> tuple:
+        """
+        Write the archive and index of `{repository path: local path}` into `directory`.
+
+        `shas` holds the blob SHA of each file. Returns `(index path, archive path)`.
+        """
+        fd, archive_path = tempfile.mkstemp(dir=directory, prefix=".ss-bundle-", suffix=".zip")
+        os.close(fd)
+        entries = {}
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+            for repo_path in sorted(files):
+                info = zipfile.ZipInfo(repo_path, date_time=Bundle.DATE_TIME)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                with open(files[repo_path], "rb") as source, archive.open(info, "w") as target:
+                    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                        target.write(chunk)
+                entries[repo_path] = {"sha": shas[repo_path], "size": os.path.getsize(files[repo_path])}
+
+        index_path = archive_path[:-len(".zip")] + ".json"
+        with open(index_path, "w", encoding="utf-8") as index_file:
+            json.dump({"version": Bundle.VERSION, "format": "zip", "entries": entries}, index_file, indent=2, sort_keys=True)
+        return index_path, archive_path
+
+    def read_index(index_path: str) -> dict:
+        """
+        Return `{repository path: blob sha}` from an index file.
+        """
+        index = Files.read_json(index_path, {})
+        if index.get("version") != Bundle.VERSION or index.get("format") != "zip":
+            raise ValueError(f"Unsupported bundle index version {index.get('version')}")
+        return {repo_path: entry["sha"] for repo_path, entry in index["entries"].items()}
+
+    def extract(archive_path: str, targets: dict, shas: dict) -> dict:
+        """
+        Extract only the entries in `{repository path: target path}` to temp files next to their targets,
+        verifying each against its SHA and leaving the swap to the caller.
+
+        Returns `{repository path: temp file path}`.
+        """
+        temp_paths = {}
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                for repo_path, target_path in targets.items():
+                    with archive.open(repo_path) as source:
+                        temp_paths[repo_path] = Files.write_chunks_to_temp(
+                            target_path, iter(lambda: source.read(1024 * 1024), b"")
+                        )
+                    if Files.file_blob_sha(temp_paths[repo_path]) != shas[repo_path]:
+                        raise ValueError(f"Bundle entry {repo_path} does not match its index")
+        except BaseException:
+            for temp_path in temp_paths.values():
+                os.remove(temp_path)
+            raise
+        return temp_paths
@@ -0,0 +1,184 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from modules.metrics import Metrics
+from modules.profiler import Profiler
+from modules.scheduler import Scheduler
+from modules.variables import Variables
+
+
+class Client:
+    """
+    Base class for the HTTP session shared by every GitHub call of a CLI invocation.
+    """
+    API_URL = os.environ.get("SS_API_URL", "https://api.github.com")  # Overridable for local testing
+    TIMEOUT = (10, 60)  # (connect, read) seconds
+    IDENTITY_TTL = 24 * 60 * 60  # Seconds the cached login and repo name stay valid
+    CONCURRENCY = 4  # Requests in flight at once when calls are gathered, kept below the session's pool size
+
+    _session = None
+
+    def session() -> requests.Session:
+        """
+        Return the shared keep-alive session, creating it on first use.
+        """
+        if Client._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept": "application/vnd.github.v3+json"})
+            Client._session = session
+            Client.refresh_token()
+        return Client._session
+
+    def refresh_token() -> None:
+        """
+        Authenticate the shared session with the token currently in the `.env` file,
+        for processes that outlive a `ss login` (`ss watch`).
+        """
+        if Client._session is None:
+            return
+        token = Variables.get_var("GH_TOKEN")
+        if token:
+            Client._session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            Client._session.headers.pop("Authorization", None)
+
+    def request(method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the shared session. `url` may be a path relative to the API root.
+        """
+        if url.startswith("/"):
+            url = Client.API_URL + url
+        kwargs.setdefault("timeout", Client.TIMEOUT)
+        # Streamed bodies (generators) cannot be replayed, so those are sent once
+        replayable = isinstance(kwargs.get("data"), (type(None), bytes, str, dict))
+
+        attempt = 0
+        while True:
+            Scheduler.wait()
+            started = Profiler.now()
+            clock = time.perf_counter()
+            try:
+                response = Client.session().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                Profiler.record_http(method, url, 0, 0, 0, started)
+                Client._count(method, url, 0, clock)
+                delay = Scheduler.retry_delay(method, attempt, error=e) if replayable else None
+                if delay is None:
+                    raise
+            else:
+                if Profiler.enabled:
+                    Client._profile(method, url, response, started, kwargs.get("stream", False))
+                Client._count(method, url, response.status_code, clock)
+                Scheduler.observe(response)
+                delay = Scheduler.retry_delay(method, attempt, response=response) if replayable else None
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _profile(method: str, url: str, response: requests.Response, started: float, stream: bool) -> None:
+        """Hand the size of a request and its response to the profiler."""
+        body = response.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else int(response.request.headers.get("Content-Length", 0))
+        if stream:
+            received = int(response.headers.get("Content-Length", 0))
+        else:
+            received = len(response.content)
+        Profiler.record_http(method, url, response.status_code, sent, received, started)
+
+    def _count(method: str, url: str, status: int, clock: float) -> None:
+        """Record a request and its duration in the sync metrics."""
+        endpoint = Profiler.endpoint(method, url)
+        Metrics.inc("ss_http_requests_total", endpoint=endpoint, status=status)
+        Metrics.observe("ss_http_request_duration_seconds", time.perf_counter() - clock, endpoint=endpoint)
+
+    def get(url: str, **kwargs) -> requests.Response:
+        return Client.request("GET", url, **kwargs)
+
+    def post(url: str, **kwargs) -> requests.Response:
+        return Client.request("POST", url, **kwargs)
+
+    def put(url: str, **kwargs) -> requests.Response:
+        return Client.request("PUT", url, **kwargs)
+
+    def patch(url: str, **kwargs) -> requests.Response:
+        return Client.request("PATCH", url, **kwargs)
+
+    def gather(calls: list, limit: int = CONCURRENCY, return_exceptions: bool = False) -> list:
+        """
+        Run independent blocking calls concurrently on a pool of `limit` threads.
+
+        The calls share the keep-alive session and the scheduler's rate-limit pacing.
+        Returns their results in the order of `calls`. Every call runs to completion
+        before the first error, if any, is raised; with `return_exceptions` errors are
+        returned in place of results instead, so callers can clean up after the others.
+        """
+        def run(call):
+            try:
+                return call()
+            except Exception as e:
+                return e
+
+        if not calls:
+            return []
+        with ThreadPoolExecutor(max_workers=limit) as pool:
+            results = list(pool.map(run, calls))
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def remember_identity(login: str) -> tuple:
+        """
+        Cache the login and the sync repository name in the `.env` file.
+        """
+        repo_name = f"{login}-VSCode-Settings-Sync"
+        if Variables.get_var("GH_LOGIN") != login:
+            Variables.put_var("GH_BRANCH", "")
+        Variables.put_var("GH_LOGIN", login)
+        Variables.put_var("GH_REPO", repo_name)
+        Variables.put_var("GH_IDENTITY_EXPIRES", str(int(time.time()) + Client.IDENTITY_TTL))
+        return login, repo_name
+
+    def forget_identity() -> None:
+        """
+        Expire the cached identity, e.g. when the token changes.
+        """
+        Variables.put_var("GH_IDENTITY_EXPIRES", "0")
+        Variables.put_var("GH_BRANCH", "")
+
+    def identity() -> tuple:
+        """
+        Return `(login, repo_name)` for the current token, only calling /user when the cache has expired.
+        """
+        login = Variables.get_var("GH_LOGIN")
+        repo_name = Variables.get_var("GH_REPO")
+        expires = Variables.get_var("GH_IDENTITY_EXPIRES")
+        if login and repo_name and expires and int(expires) > time.time():
+            return login, repo_name
+
+        with Profiler.phase("identity (/user)"):
+            response = Client.get("/user")
+            response.raise_for_status()
+        return Client.remember_identity(response.json()["login"])
+
+    def default_branch(repo_owner: str, repo_name: str) -> str:
+        """
+        Return the default branch of the sync repository, cached alongside the identity.
+        """
+        branch = Variables.get_var("GH_BRANCH")
+        if branch:
+            return branch
+
+        response = Client.get(f"/repos/{repo_owner}/{repo_name}")
+        response.raise_for_status()
+        branch = response.json()["default_branch"]
+        Variables.put_var("GH_BRANCH", branch)
+        return branch
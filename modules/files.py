@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+
+class Files:
+    """
+    Base class for local file-related actions.
+    """
+    def blob_sha(content: bytes) -> str:
+        """
+        Compute the git blob SHA of `content`, the same way `git hash-object` does.
+        """
+        header = f"blob {len(content)}\0".encode("utf-8")
+        return hashlib.sha1(header + content).hexdigest()
+
+    def file_blob_sha(file_path: str) -> str:
+        """
+        Compute the git blob SHA of a file on disk without reading it into memory at once.
+        """
+        sha = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode("utf-8"))
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def hash_files(files: dict, max_workers: int = 8) -> dict:
+        """
+        Compute the git blob SHAs of `{key: file path}` in parallel, returning `{key: sha}`.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(zip(files, pool.map(Files.file_blob_sha, files.values())))
+
+    def read_json(file_path: str, default=None):
+        """
+        Read a JSON file, returning `default` when it is missing or unreadable.
+        """
+        try:
+            with open(file_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return default
+
+    def write_chunks_to_temp(file_path: str, chunks) -> str:
+        """
+        Write `chunks` to a temp file in the same folder as `file_path` and return its path.
+
+        The temp file can then be moved over `file_path` atomically with `os.replace`.
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".ss-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path
+
+    def write_bytes(file_path: str, content: bytes) -> None:
+        """
+        Atomically replace `file_path` with `content`.
+        """
+        os.replace(Files.write_chunks_to_temp(file_path, [content]), file_path)
+
+    def write_json(file_path: str, data) -> None:
+        """
+        Atomically write `data` as JSON to `file_path`.
+        """
+        Files.write_bytes(file_path, json.dumps(data, indent=2, sort_keys=True).encode("utf-8"))
+
+    def running_as_root() -> bool:
+        return hasattr(os, "geteuid") and os.geteuid() == 0
+
+    def symlink_below(path: str, root: str) -> Union[str, None]:
+        """Return the first component of `path` below `root` that is a symbolic link, or None."""
+        root = os.path.abspath(root)
+        current = root
+        for part in os.path.relpath(os.path.abspath(path), root).split(os.sep):
+            current = os.path.join(current, part)
+            if os.path.islink(current):
+                return current
+        return None
+
+    def chown_like(paths: list, reference: str) -> None:
+        """
+        Give `paths`, and the folders between them and `reference`, the owner of `reference`.
+
+        Only does something when running as root, e.g. when writing into other users' homes.
+        """
+        if not Files.running_as_root():
+            return
+        owner = os.stat(reference)
+        reference = os.path.abspath(reference)
+        changed = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            while path.startswith(reference + os.sep) and path not in changed:
+                os.chown(path, owner.st_uid, owner.st_gid, follow_symlinks=False)
+                changed.add(path)
+                path = os.path.dirname(path)
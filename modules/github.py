@@ -1,38 +1,76 @@
 import base64
+import functools
 import os
-import time
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import requests
+from modules.bundle import Bundle
+from modules.client import Client
+from modules.files import Files
+from modules.gitstore import GitStore
+from modules.journal import Journal
+from modules.lockfile import Lockfile
+from modules.merge import Merge
+from modules.metrics import Metrics
+from modules.profiler import Profiler
+from modules.snapshot import Snapshot
 from modules.variables import Variables
 from modules.vscode import VSCode
-from typing import Union
-import subprocess
-import json
-import urllib.parse
 from pathlib import Path
+from typing import Union
 
 class GitHub:
     """
     Base class for GitHub-related actions.
     """
+    MANIFEST_PATH = ".sync-manifest.json"  # Blob SHAs of the last synced version of each file
+    CACHE_PATH = ".sync-cache.json"  # Remote tree listings and their ETags, one per branch plus the last tree listed by SHA
+    BUNDLE_INDEX_PATH = ".sync-bundle-index.json"  # Last downloaded bundle index
+    BUNDLE_ARCHIVE_PATH = ".sync-bundle.zip"  # Download location of the bundle archive while extracting
+    APPLIED_PATH = ".sync-applied.json"  # Blob SHAs of what was applied to a home's User folder by `sync-get --homes`
+    INLINE_LIMIT = 256 * 1024  # Largest file sent inline in a tree request, larger ones use the blob API
+
+    def storage(repo_owner: str, repo_name: str):
+        """
+        Return the backend for repository I/O, brought up to date for this sync.
+
+        That is `GitStore` when `SS_TRANSPORT=git` is set in the `.env` file, and this
+        class (the REST API) otherwise or when git cannot reach the repository.
+        """
+        if Variables.get_var("SS_TRANSPORT") != "git":
+            return GitHub
+        if not GitStore.available():
+            print("git was not found, using the REST API instead.")
+            return GitHub
+        try:
+            with Profiler.phase("git fetch"):
+                GitStore.connect(repo_owner, repo_name)
+        except GitStore.Error as e:
+            print(f"Could not fetch the repository with git ({e}), using the REST API instead.")
+            return GitHub
+        return GitStore
+
+    def default_branch(repo_owner: str, repo_name: str) -> str:
+        """
+        Return the default branch of the sync repository, see `Client.default_branch`.
+        """
+        return Client.default_branch(repo_owner, repo_name)
+
     def create_repo() -> int:
         """
         Creates a new GitHub repository for syncing.
         """
-        url = "https://api.github.com/user/repos"
-        token = Variables.get_var("gh_token")
-        
+        # A cached default branch means the repository has been seen already
+        if Variables.get_var("GH_BRANCH"):
+            return 422
+
         try:
-            user_info = requests.get("https://api.github.com/user", headers={
-                "Authorization": f"token {token}"
-                }).json()
-            name = user_info.get("login", None)
-        except KeyError:
+            name, repo_name = Client.identity()
+        except (KeyError, requests.exceptions.HTTPError):
             print("Invalid GitHub Token, do `ss login` again to reverify the token.")
             return 401  # Return an appropriate status code for an invalid token
 
-        repo_name = None or f"{name}-VSCode-Settings-Sync"
-
         body = {
             "name": repo_name,
             "description": "A repository for storing your VSCode settings",
@@ -41,24 +79,13 @@ class GitHub:
             "auto_init": True,  # Initialize with a README
         }
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json",  # Specify API version
-        }
-
         try:
-            r = requests.post(url, json=body, headers=headers)
+            r = Client.post("/user/repos", json=body)
             r.raise_for_status()  # Raise HTTPError for bad responses
 
             # Check if the repository was successfully created
             if r.status_code == 201:
                 print("Repository created successfully!")
-            elif r.status_code == 422:
-                reset_time = int(r.headers["X-RateLimit-Reset"])
-                print(f"Rate limit exceeded. Reset time: {reset_time}")
-                print("Retrying create_repo process after reset time...")
-                time.sleep(reset_time - int(time.time()))
-                return GitHub.create_repo() # Return the result of the recursive call
             else:
                 print(f"Error creating repository. Status code: {r.status_code}")
 
@@ -74,6 +101,9 @@ class GitHub:
         except requests.exceptions.HTTPError as http_error:
             if http_error.response.status_code == 401:
                 print("Unauthorized access. Please check your GitHub token.")
+            elif http_error.response.status_code == 422:
+                # The repository already exists, rate limits are handled by the scheduler
+                pass
             else:
                 print(f"HTTP error: {http_error.response.status_code}")
             return http_error.response.status_code
@@ -86,170 +116,796 @@ class GitHub:
             print(f"Unexpected error: {e}")
             return 500  # You can choose an appropriate status code for unexpected errors
 
-    def send_files_to_repo() -> None:
-        """Send setting files (settings.json, extensions-list.json, keybindings.json) to the rpeository."""
-        # Put settings.json and extensions-list.json into same dir as script
-        # 1. Settings
-        settings_content = VSCode.locate_settings_file()
-        settings_file_path = os.path.abspath("./settings.json")
-        with open(settings_file_path, "w") as file:
-            file.write(settings_content)
-        
-        # 2. Extensions
-        VSCode.extract_extensions_info()
-        extensions_file_path = os.path.abspath("./extensions-list.json")
-
-        # 3. Keybinds
-        keybinds_content = VSCode.locate_keybinds_file()
-        keybinds_file_path = os.path.abspath("./keybinds.json")
-        with open(keybinds_file_path, "w") as file:
-            file.write(keybinds_content)
-
-        # Load GitHub token from environment variables
-        github_token = Variables.get_var("GH_TOKEN")
-
-        # Repository details
-        repo_owner = requests.get("https://api.github.com/user", headers={"Authorization": f"token {github_token}"}).json()["login"]
-        repo_name = f"{repo_owner}-VSCode-Settings-Sync"  # Replace with your repository name
-
-        # GitHub API URLs
-        repo_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/"
-        settings_url = repo_url + "settings.json"
-        extensions_url = repo_url + "extensions-list.json"
-        keybinds_url = repo_url + "keybinds.json"
-
-        # Headers with authorization
-        headers = {
-            "Authorization": f"Bearer {github_token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
+    def list_local_files() -> dict:
+        """
+        List the files to sync as `{repository path: local path}`.
 
-        try:
-            # Function to upload a file to GitHub repository
-            def upload_file(file_path: str, target_url: str) -> None:
-                """Helper function for `send_files_to_repo` to upload files."""
-                with open(file_path, "rb") as file:
-                    content = file.read()
-                    encoded_content = base64.b64encode(content).decode("utf-8")
+        User folder files are read straight from VSCode's User folder, the extensions
+        lockfile is generated into the same dir as the script and removed by the caller.
+        """
+        with Profiler.phase("extract_extensions_info"):
+            VSCode.extract_extensions_info()
+        extensions_file_path = os.path.abspath(Lockfile.NAME)
 
-                # Check if the file already exists
-                existing_file_sha = get_existing_file_sha(target_url)
+        user_folder = VSCode.locate_user_folder()
+        files = VSCode.list_user_files(user_folder) if user_folder else {}
+        if os.path.exists(extensions_file_path):
+            files[Lockfile.NAME] = extensions_file_path
+        return files
 
-                body = {
-                    "message": f"Syncing VSCode settings ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})",
-                    "content": encoded_content,
-                }
+    def send_files_to_repo(bundle: bool = False) -> None:
+        """
+        Send setting files (settings.json, keybindings.json, snippets, profiles, tasks.json and the extensions list) to the repository.
 
-                # If the file exists, include the SHA of the existing file in the request
-                if existing_file_sha:
-                    body["sha"] = existing_file_sha
+        With `bundle`, the files are stored as one compressed archive plus an index instead of one file each.
+        """
+        files = GitHub.list_local_files()
+        extensions_file_path = os.path.abspath(Lockfile.NAME)
+
+        # Compare against the last synced version first, so an unchanged run makes no API calls
+        manifest = Files.read_json(GitHub.MANIFEST_PATH, {"files": {}})
+        with Profiler.phase("hash local files"):
+            local_shas = Files.hash_files(files)
+        synced = manifest["files"]
+        removed = [
+            repo_path for repo_path in synced
+            if VSCode.is_user_tree_path(repo_path) and repo_path not in files
+        ]
+        temp_paths = []
 
-                response = requests.put(target_url, headers=headers, json=body)
-                response.raise_for_status()
-                os.remove(file_path)
-                print(f"File {file_path} uploaded successfully!")
+        try:
+            if removed or manifest.get("bundle", False) != bundle \
+                    or any(synced.get(repo_path) != sha for repo_path, sha in local_shas.items()):
+                # A run interrupted on its way to the same local state picks up where it stopped
+                Journal.begin(
+                    "sync-send", Journal.target_of({"files": local_shas, "bundle": bundle}),
+                    [os.path.dirname(extensions_file_path)] + [os.path.dirname(file_path) for file_path in files.values()],
+                )
+
+                # Repository details
+                repo_owner, repo_name = Client.identity()
+                store = GitHub.storage(repo_owner, repo_name)
+
+                # One listing of the remote tree tells what actually needs transferring
+                with Profiler.phase("list remote tree"):
+                    head_sha, base_tree_sha = store.get_head(repo_owner, repo_name)
+                    tree_shas = store.list_remote_files(repo_owner, repo_name, base_tree_sha)
+                    remote_shas, bundled, archive_sha = GitHub.read_bundle(store, repo_owner, repo_name, tree_shas)
+                # Files changed on both sides since the last sync are merged before pushing,
+                # whether the remote copy is a loose file or an entry of the bundle
+                remote_copies = GitHub.fetch_remote_copies(store, repo_owner, repo_name, {
+                    repo_path: file_path for repo_path, file_path in files.items()
+                    if (Merge.is_mergeable(repo_path) or repo_path == Lockfile.NAME)
+                    and remote_shas.get(repo_path) not in (None, synced.get(repo_path), local_shas[repo_path])
+                }, remote_shas, bundled, archive_sha)
+                temp_paths += list(remote_copies.values())
+                for repo_path, temp_path in remote_copies.items():
+                    file_path = files[repo_path]
+                    if repo_path == Lockfile.NAME:
+                        # Hashes another machine locked since the last sync are kept
+                        try:
+                            remote_lockfile = Lockfile.read(temp_path)
+                        except ValueError as e:
+                            print(f"Could not read the remote {Lockfile.NAME}: {e}")
+                            remote_lockfile = {}
+                        Lockfile.write(file_path, Lockfile.merge_hashes(Lockfile.read(file_path), remote_lockfile))
+                    else:
+                        merged = GitHub.merge_settings(repo_path, file_path, temp_path)
+                        if merged is None:
+                            continue
+                        Files.write_bytes(file_path, merged.encode("utf-8"))
+                    local_shas[repo_path] = Files.file_blob_sha(file_path)
+
+                if bundle:
+                    # The archive replaces the individual files, so loose copies left
+                    # from an earlier sync are removed to keep one source of truth
+                    with Profiler.phase("build bundle"):
+                        index_path, archive_path = Bundle.build(files, local_shas, os.path.dirname(extensions_file_path))
+                    temp_paths += [index_path, archive_path]
+                    bundle_files = {Bundle.INDEX_NAME: index_path, Bundle.ARCHIVE_NAME: archive_path}
+                    changed = {
+                        repo_path: file_path for repo_path, file_path in bundle_files.items()
+                        if tree_shas.get(repo_path) != Files.file_blob_sha(file_path)
+                    }
+                    deleted = [repo_path for repo_path in tree_shas if GitHub.is_synced_path(repo_path)]
+                else:
+                    changed = {
+                        repo_path: file_path for repo_path, file_path in files.items()
+                        if tree_shas.get(repo_path) != local_shas[repo_path]
+                    }
+                    deleted = [repo_path for repo_path in removed if repo_path in tree_shas]
+                    deleted += [repo_path for repo_path in Bundle.NAMES if repo_path in tree_shas]
+                    # The lockfile replaces the extensions list of earlier versions
+                    if files.get(Lockfile.NAME) and Lockfile.LEGACY_NAME in tree_shas:
+                        deleted.append(Lockfile.LEGACY_NAME)
+
+                if changed or deleted:
+                    # Push the changes as a single commit
+                    with Profiler.phase("push_files"):
+                        manifest["commit"] = store.push_files(
+                            repo_owner, repo_name, changed, deleted, (head_sha, base_tree_sha)
+                        )
+                    Metrics.inc("ss_files_uploaded_total", len(changed))
+                    Metrics.inc("ss_files_deleted_total", len(deleted))
+                else:
+                    print("Repository is already up to date, nothing to sync.")
+
+                manifest["files"] = local_shas
+                manifest["bundle"] = bundle
+                Files.write_json(GitHub.MANIFEST_PATH, manifest)
+                for repo_path, file_path in files.items():
+                    if Merge.is_mergeable(repo_path):
+                        Merge.save_base(repo_path, file_path)
+                if Lockfile.NAME in files:
+                    Lockfile.save_synced(extensions_file_path)
+                # The pushed state becomes the latest snapshot, so `sync-get --offline` does not bring back an older one
+                pushed = {
+                    repo_path: sha for repo_path, sha in tree_shas.items()
+                    if GitHub.is_synced_path(repo_path) and repo_path not in deleted
+                }
+                pushed.update(local_shas)
+                GitHub.fill_snapshot(store, repo_owner, repo_name, pushed, {}, None, local_files=files)
+                Journal.finish()
+            else:
+                print("Settings are already up to date, nothing to sync.")
 
-            # Function to get the SHA of an existing file
-            def get_existing_file_sha(target_url: str) -> Union[str, None]:
-                """Get the SHA for the existing setting files."""
-                response = requests.get(target_url, headers=headers)
-                
-                if response.status_code == 200:
-                    return response.json().get("sha")
+        except (requests.exceptions.RequestException, GitStore.Error, ValueError) as e:
+            print(f"Error during sync: {e}")
+            Metrics.fail()
 
-                return None
+        finally:
+            for temp_path in [extensions_file_path] + temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            Journal.release()
 
+    def get_head(repo_owner: str, repo_name: str) -> tuple:
+        """
+        Return `(commit sha, tree sha)` of the HEAD of the default branch.
+        """
+        branch = Client.default_branch(repo_owner, repo_name)
+        branch_info = Client.get(f"/repos/{repo_owner}/{repo_name}/branches/{branch}")
+        branch_info.raise_for_status()
+        commit = branch_info.json()["commit"]
+        return commit["sha"], commit["commit"]["tree"]["sha"]
 
-            # Upload settings.json
-            upload_file(settings_file_path, settings_url)
+    def list_remote_files(repo_owner: str, repo_name: str, tree_ish: str) -> dict:
+        """
+        List every file of a tree (a tree SHA or a branch name) in one call, as `{path: blob sha}`.
 
-            # Upload extensions-list.json
-            upload_file(extensions_file_path, extensions_url)
+        The listing of a branch is revalidated with its cached ETag, so an unchanged tree costs
+        a free 304, and a tree listed by SHA again is not requested at all. The cache keeps one
+        listing per branch and the last one by SHA, replaced as they change.
+        Raises `ValueError` when GitHub truncates the listing, as files would be missing from it.
+        """
+        by_sha = re.fullmatch(r"[0-9a-f]{40}", tree_ish) is not None
+        key = f"{repo_owner}/{repo_name}:{'tree' if by_sha else tree_ish}"
+        cache = Files.read_json(GitHub.CACHE_PATH, {})
+        cached = cache.get(key)
+        if cached and cached["tree_ish"] != tree_ish:
+            cached = None
+        if cached and by_sha:
+            # A tree never changes once written
+            return cached["files"]
+
+        url = f"/repos/{repo_owner}/{repo_name}/git/trees/{tree_ish}?recursive=1"
+        response = Client.get(url, headers={"If-None-Match": cached["etag"]} if cached else {})
+        if response.status_code == 304:
+            return cached["files"]
+        response.raise_for_status()
+
+        listing = response.json()
+        if listing.get("truncated"):
+            raise ValueError(f"GitHub truncated the listing of {tree_ish}, the repository has too many files to sync")
+        files = {entry["path"]: entry["sha"] for entry in listing["tree"] if entry["type"] == "blob"}
+        etag = response.headers.get("ETag")
+        if etag or by_sha:
+            # Earlier versions kept every listing, keyed by URL
+            cache = {name: entry for name, entry in cache.items() if "tree_ish" in entry}
+            cache[key] = {"tree_ish": tree_ish, "etag": etag, "files": files}
+            Files.write_json(GitHub.CACHE_PATH, cache)
+        return files
+
+    def read_bundle(store, repo_owner: str, repo_name: str, remote_shas: dict) -> tuple:
+        """
+        Replace the bundle files and any loose synced files of a tree listing with the entries of the bundle index.
 
-            # Upload keybinds.json
-            upload_file(keybinds_file_path, keybinds_url)
+        The index is only downloaded again when its blob changed. Returns
+        `(remote shas, {bundled path: sha}, archive sha)`, unchanged when the tree has no bundle.
+        """
+        if Bundle.INDEX_NAME not in remote_shas:
+            return remote_shas, {}, None
+        index_sha = remote_shas[Bundle.INDEX_NAME]
+        if not os.path.isfile(GitHub.BUNDLE_INDEX_PATH) or Files.file_blob_sha(GitHub.BUNDLE_INDEX_PATH) != index_sha:
+            with Profiler.phase("download bundle index"):
+                store.download_blob(repo_owner, repo_name, index_sha, os.path.abspath(GitHub.BUNDLE_INDEX_PATH))
+        bundled = Bundle.read_index(GitHub.BUNDLE_INDEX_PATH)
+        # The bundle is the whole synced state, loose copies an older send left behind are ignored
+        expanded = {
+            repo_path: sha for repo_path, sha in remote_shas.items()
+            if repo_path not in Bundle.NAMES and not GitHub.is_synced_path(repo_path)
+        }
+        expanded.update(bundled)
+        return expanded, bundled, remote_shas[Bundle.ARCHIVE_NAME]
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error during sync: {e}")
+    def fetch_remote_copies(store, repo_owner: str, repo_name: str, targets: dict, remote_shas: dict, bundled: dict,
+                            archive_sha: str) -> dict:
+        """
+        Download the remote copies of the files in `{repository path: target path}` to temp files next to
+        their targets, leaving the swap to the caller. Bundled entries come out of one archive download.
 
-    def get_files_from_repo() -> None:
-        """Get setting files (settings.json, extensions-list.json, keybindings.json) from the rpeository."""
-        # Load GitHub token from environment variables
-        github_token = Variables.get_var("GH_TOKEN")
-
-        # Repository details
-        user_info = requests.get("https://api.github.com/user", headers={"Authorization": f"token {github_token}"}).json()
-        repo_owner = user_info.get("login", None)
-        repo_name = None or f"{repo_owner}-VSCode-Settings-Sync"  # Replace with your repository name
-
-        # GitHub API URLs
-        if repo_name is not None:
-            repo_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/"
-            settings_url = repo_url + "settings.json"
-            extensions_url = repo_url + "extensions-list.json"
-            keybinds_url = repo_url + "keybinds.json"
-
-            # Headers with authorization
-            headers = {
-                "Authorization": f"Bearer {github_token}",
-                "Accept": "application/vnd.github.v3+json",
-            }
-
-            def download_file(file_url: str, target_path: str) -> None:
-                """Helper function for `get_files_from_repo` to download files."""
-                response = requests.get(file_url, headers=headers)
-                response.raise_for_status()
-
-                # Decode content and handle encoding issues
+        Returns `{repository path: temp file path}`.
+        """
+        temp_paths = {}
+        try:
+            for repo_path, target_path in targets.items():
+                if repo_path not in bundled:
+                    temp_paths[repo_path] = store.fetch_blob(repo_owner, repo_name, remote_shas[repo_path], target_path)
+            extract = {repo_path: target_path for repo_path, target_path in targets.items() if repo_path in bundled}
+            if extract:
+                archive_path = store.fetch_blob(
+                    repo_owner, repo_name, archive_sha, os.path.abspath(GitHub.BUNDLE_ARCHIVE_PATH)
+                )
                 try:
-                    content = base64.b64decode(response.json()["content"]).decode("utf-8")
-                except UnicodeDecodeError as e:
-                    print(f"UnicodeDecodeError: {e}")
-                    content = base64.b64decode(response.json()["content"]).decode("utf-8", errors="replace")
+                    with Profiler.phase("extract bundle entries"):
+                        temp_paths.update(Bundle.extract(archive_path, extract, remote_shas))
+                finally:
+                    os.remove(archive_path)
+        except BaseException:
+            for temp_path in temp_paths.values():
+                os.remove(temp_path)
+            raise
+        return temp_paths
+
+    def push_files(repo_owner: str, repo_name: str, files: dict, deleted: list = (), head: tuple = None) -> str:
+        """
+        Push local files to the repository as one commit through the Git Data API.
 
-                # Write to the target file with utf-8 encoding using writebytes
-                with open(target_path, 'wb') as file:
-                    file.write(content.encode("utf-8"))
+        `files` maps the path inside the repository to the local file path, `deleted`
+        lists repository paths to remove. `head` is the `(commit sha, tree sha)` to
+        build on, resolved from the default branch when not given.
+        Returns the SHA of the new commit.
+        """
+        api_url = f"/repos/{repo_owner}/{repo_name}"
+
+        # Resolve the current HEAD commit and its tree on the default branch
+        branch = Client.default_branch(repo_owner, repo_name)
+        head_sha, base_tree_sha = head or GitHub.get_head(repo_owner, repo_name)
+
+        # A commit already written on top of the same HEAD by an interrupted run only needs the branch moved to it
+        written = Journal.get("commit")
+        if written and written["head"] == head_sha:
+            return GitHub.move_branch(api_url, branch, written["sha"], files, deleted)
+
+        # Build one tree on top of HEAD's tree. Small text files are sent inline
+        # so GitHub creates their blobs as part of the tree request, anything
+        # else is streamed to the blob endpoint first.
+        tree, uploads = [], []
+        for repo_path, file_path in files.items():
+            entry = {"path": repo_path, "mode": "100644", "type": "blob"}
+            content = None
+            if os.path.getsize(file_path) <= GitHub.INLINE_LIMIT:
+                with open(file_path, "rb") as file:
+                    try:
+                        content = file.read().decode("utf-8")
+                    except UnicodeDecodeError:
+                        pass
+            if content is not None:
+                entry["content"] = content
+            else:
+                # Blobs are named by their content, so one uploaded by an interrupted run is reused as is
+                sha = Files.file_blob_sha(file_path)
+                if sha in Journal.get("blobs", {}):
+                    entry["sha"] = sha
+                else:
+                    uploads.append(entry)
+            tree.append(entry)
+        # Blob uploads are independent of each other, so they overlap
+        with Profiler.phase("upload_blob (base64 stream)"):
+            shas = Client.gather([
+                functools.partial(GitHub.upload_blob, api_url, files[entry["path"]]) for entry in uploads
+            ])
+        for entry, sha in zip(uploads, shas):
+            entry["sha"] = sha
+        for repo_path in deleted:
+            tree.append({"path": repo_path, "mode": "100644", "type": "blob", "sha": None})
+
+        tree_response = Client.post(f"{api_url}/git/trees", json={
+            "base_tree": base_tree_sha,
+            "tree": tree,
+        })
+        tree_response.raise_for_status()
+
+        # Write the commit and move the branch to it
+        new_commit = Client.post(f"{api_url}/git/commits", json={
+            "message": f"Syncing VSCode settings ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})",
+            "tree": tree_response.json()["sha"],
+            "parents": [head_sha],
+        })
+        new_commit.raise_for_status()
+        commit_sha = new_commit.json()["sha"]
+        Journal.record("commit", {"head": head_sha, "sha": commit_sha})
+
+        return GitHub.move_branch(api_url, branch, commit_sha, files, deleted)
+
+    def move_branch(api_url: str, branch: str, commit_sha: str, files: dict, deleted: list) -> str:
+        """
+        Point the branch at a pushed commit and report the files it changed. Returns the commit SHA.
+        """
+        ref_update = Client.patch(f"{api_url}/git/refs/heads/{branch}", json={
+            "sha": commit_sha,
+        })
+        ref_update.raise_for_status()
+
+        for file_path in files.values():
+            print(f"File {file_path} uploaded successfully!")
+        for repo_path in deleted:
+            print(f"File {repo_path} deleted from the repository.")
 
-                print(f"File downloaded successfully to {target_path}")
+        return commit_sha
 
-            def install_extensions_from_list(extension_list_path):
-                with open(extension_list_path, 'r') as file:
-                    extensions_data = json.load(file)
+    def upload_blob(api_url: str, file_path: str) -> str:
+        """
+        Stream a file to the blob endpoint, base64-encoding it chunk by chunk.
 
-                # Construct a list of extension installation commands
-                extension_commands = []
-                for _, extension_info in extensions_data.items():
-                    extension_url = extension_info['url']
-                    extension_name = urllib.parse.unquote(extension_url.split("itemName=")[-1])
-                    extension_commands.append(f"code --install-extension {extension_name}")
+        Returns the SHA of the created blob.
+        """
+        def body():
+            yield b'{"encoding": "base64", "content": "'
+            with open(file_path, "rb") as file:
+                # Chunks are a multiple of 3 bytes so they encode without padding
+                for chunk in iter(lambda: file.read(3 * 256 * 1024), b""):
+                    yield base64.b64encode(chunk)
+            yield b'"}'
+
+        response = Client.post(f"{api_url}/git/blobs", data=body(), headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+        sha = response.json()["sha"]
+        Journal.add("blobs", sha, True)
+        return sha
+
+    def download_blob(repo_owner: str, repo_name: str, sha: str, target_path: str) -> None:
+        """
+        Stream a blob straight to a temp file next to `target_path` and swap it in atomically.
+        """
+        os.replace(GitHub.fetch_blob(repo_owner, repo_name, sha, target_path), target_path)
 
-                # Join all commands into a single long command
-                command = " && ".join(extension_commands)
+    def fetch_blob(repo_owner: str, repo_name: str, sha: str, target_path: str) -> str:
+        """
+        Stream a blob to a temp file next to `target_path` and verify it, leaving the swap to the caller.
 
-                # Execute the single long command
-                subprocess.run(command, shell=True)
+        Returns the temp file path.
+        """
+        response = Client.get(
+            f"/repos/{repo_owner}/{repo_name}/git/blobs/{sha}",
+            headers={"Accept": "application/vnd.github.raw"},
+            stream=True,
+        )
+        response.raise_for_status()
+        temp_path = Files.write_chunks_to_temp(target_path, response.iter_content(64 * 1024))
+        if Files.file_blob_sha(temp_path) != sha:
+            os.remove(temp_path)
+            raise ValueError(f"Downloaded content of {target_path} does not match blob {sha}")
+        return temp_path
+
+    def merge_settings(repo_path: str, local_path: str, remote_path: str, base: str = None) -> Union[str, None]:
+        """
+        Three-way merge the remote copy of a settings file into the local one against their base snapshot,
+        or against `base` when given.
+
+        Returns the merged text, or None when there is no base snapshot yet or a file cannot be parsed.
+        """
+        if base is None:
+            base = Merge.read_base(repo_path)
+        if base is None:
+            return None
+        try:
+            with open(local_path, "r", encoding="utf-8", newline="") as file:
+                local = file.read()
+            with open(remote_path, "r", encoding="utf-8", newline="") as file:
+                remote = file.read()
+            merged, conflicts = Merge.merge(base, local, remote)
+        except ValueError as e:
+            print(f"Could not merge {repo_path}: {e}")
+            return None
+        for key in conflicts:
+            print(f"Conflict in {repo_path}: \"{key}\" was changed on both sides, kept the local value.")
+        return merged
+
+    def apply_download(repo_path: str, temp_path: str, target_path: str, merge: bool = False) -> None:
+        """
+        Move a downloaded file into place.
+
+        With `merge`, a settings file edited locally since the last sync gets the remote
+        changes merged in instead of being overwritten.
+        """
+        if Merge.is_mergeable(repo_path):
+            merged = GitHub.merge_settings(repo_path, target_path, temp_path) if merge else None
+            Merge.save_base(repo_path, temp_path)
+            if merged is not None:
+                os.remove(temp_path)
+                Files.write_bytes(target_path, merged.encode("utf-8"))
+                return
+        os.replace(temp_path, target_path)
+
+    def is_synced_path(repo_path: str) -> bool:
+        """Tell whether a repository path is one a sync transfers, not e.g. the repository's README."""
+        return repo_path in Lockfile.NAMES or repo_path in VSCode.USER_FILES or VSCode.is_user_tree_path(repo_path)
+
+    def fill_snapshot(store, repo_owner: str, repo_name: str, remote_shas: dict, bundled: dict, archive_sha: str,
+                      local_files: dict = None) -> None:
+        """
+        Bring every blob of `remote_shas` into the snapshot cache and record them as its latest version.
 
+        Blobs already cached are not downloaded again, nor are those of `local_files`
+        (`{repository path: local path}` of files known to match the remote copy), which are copied.
+        Bundled entries come out of one archive download.
+        """
+        missing = {}
+        for repo_path, sha in remote_shas.items():
+            if sha not in missing and not Snapshot.has(repo_owner, repo_name, sha):
+                missing[sha] = repo_path
+        for repo_path, file_path in (local_files or {}).items():
+            sha = remote_shas[repo_path]
+            if sha in missing:
+                Snapshot.add_file(repo_owner, repo_name, sha, file_path)
+                del missing[sha]
+
+        downloads = [sha for sha, repo_path in missing.items() if repo_path not in bundled]
+        extract = {
+            repo_path: Snapshot.object_path(repo_owner, repo_name, sha)
+            for sha, repo_path in missing.items() if repo_path in bundled
+        }
+        calls = [
+            functools.partial(store.fetch_blob, repo_owner, repo_name, sha, Snapshot.object_path(repo_owner, repo_name, sha))
+            for sha in downloads
+        ]
+        if extract:
+            calls.append(functools.partial(
+                store.fetch_blob, repo_owner, repo_name, archive_sha, os.path.abspath(GitHub.BUNDLE_ARCHIVE_PATH)
+            ))
+
+        # The downloads overlap, they are moved into the cache once all have completed
+        with Profiler.phase("download files"):
+            fetched = Client.gather(calls, return_exceptions=True)
+        errors = [result for result in fetched if isinstance(result, BaseException)]
+        if errors:
+            for temp_path in fetched:
+                if isinstance(temp_path, str):
+                    os.remove(temp_path)
+            raise errors[0]
+
+        if extract:
+            archive_path = fetched.pop()
             try:
-                # Determine the user's home directory
-                home_dir = Path.home()
+                with Profiler.phase("extract bundle entries"):
+                    temp_paths = Bundle.extract(archive_path, extract, remote_shas)
+            finally:
+                os.remove(archive_path)
+            downloads += [remote_shas[repo_path] for repo_path in temp_paths]
+            fetched += list(temp_paths.values())
+        for sha, temp_path in zip(downloads, fetched):
+            Snapshot.add(repo_owner, repo_name, sha, temp_path)
+        Metrics.inc("ss_files_downloaded_total", len(downloads))
+        Snapshot.save(repo_owner, repo_name, remote_shas)
+
+    def lockfile_name(remote_shas: dict) -> Union[str, None]:
+        """Return the repository path of the extensions lockfile, the extensions list of earlier versions until it is migrated."""
+        return next((repo_path for repo_path in Lockfile.NAMES if repo_path in remote_shas), None)
+
+    def locked_extensions(lockfile_path: str) -> tuple:
+        """Read an extensions lockfile, in either format, into `({extension id: version}, {extension id: sha256})`."""
+        locked = Lockfile.read(lockfile_path)
+        return (
+            {extension_id: version for extension_id, (version, _) in locked.items()},
+            {extension_id: sha256 for extension_id, (_, sha256) in locked.items() if sha256},
+        )
+
+    def missing_extensions(wanted: dict, installed: dict) -> dict:
+        """Return the extensions of `wanted` that are not installed, or older than the wanted version."""
+        return {
+            extension_id: version for extension_id, version in wanted.items()
+            if extension_id.lower() not in installed
+            or VSCode.parse_version(installed[extension_id.lower()]) < VSCode.parse_version(version)
+        }
 
-                # Set the paths for settings, extensions, and keybindings
-                settings_target_path = home_dir / ".config" / "Code" / "User" / "settings.json"
-                extensions_target_path = Path.home() / "Desktop" / "extensions-list.json"
-                keybinds_target_path = home_dir / ".config" / "Code" / "User" / "keybindings.json"
+    def apply_snapshot(repo_owner: str, repo_name: str, remote_shas: dict, target: str) -> None:
+        """
+        Make the files of a sync target, a home or a VSCode data folder, match a cached snapshot.
 
-                # Download settings.json
-                download_file(settings_url, settings_target_path)
+        What was applied is recorded in the target's User folder, so later runs only write what
+        changed, remove the files deleted from the repository, and merge the remote changes into
+        settings edited locally since. As root, a target with a symbolic link anywhere below it
+        on the way to the files is refused.
+        """
+        user_folder, extensions_folder, lockfile_folder = VSCode.target_paths(target)
+        lockfile_name = GitHub.lockfile_name(remote_shas)
+        targets = {lockfile_name: os.path.join(lockfile_folder, lockfile_name)} if lockfile_name else {}
+        for repo_path in remote_shas if user_folder else ():
+            target_path = VSCode.repo_to_user_path(user_folder, repo_path)
+            if target_path is not None:
+                targets[repo_path] = target_path
+
+        state_path = os.path.join(user_folder, GitHub.APPLIED_PATH)
+        # Root writing through a link planted by the home's owner would create files wherever it points
+        if Files.running_as_root():
+            for path in list(targets.values()) + [state_path, extensions_folder]:
+                link = Files.symlink_below(path, target)
+                if link is not None:
+                    raise ValueError(f"{link} is a symbolic link, refusing to write through it as root")
+        applied = Files.read_json(state_path, {})
+        local_shas = Files.hash_files({
+            repo_path: target_path for repo_path, target_path in targets.items()
+            if os.path.isfile(target_path)
+        })
+
+        written = []
+        for repo_path, target_path in targets.items():
+            sha, applied_sha = remote_shas[repo_path], applied.get(repo_path)
+            if local_shas.get(repo_path) == sha:
+                continue
+            # Local settings edits are kept, with the remote changes since the last apply merged in
+            if Merge.is_mergeable(repo_path) and repo_path in local_shas and local_shas[repo_path] != applied_sha:
+                if sha == applied_sha:
+                    continue
+                if applied_sha and Snapshot.has(repo_owner, repo_name, applied_sha):
+                    with open(Snapshot.object_path(repo_owner, repo_name, applied_sha), "r", encoding="utf-8", newline="") as file:
+                        base = file.read()
+                    merged = GitHub.merge_settings(
+                        repo_path, target_path, Snapshot.object_path(repo_owner, repo_name, sha), base=base
+                    )
+                    if merged is not None:
+                        Files.write_bytes(target_path, merged.encode("utf-8"))
+                        written.append(target_path)
+                        continue
+            os.replace(Snapshot.copy_to_temp(repo_owner, repo_name, sha, target_path), target_path)
+            written.append(target_path)
+
+        # Files applied before and deleted from the repository since go too, unless they were changed locally
+        for repo_path, applied_sha in applied.items():
+            if not VSCode.is_user_tree_path(repo_path) or repo_path in remote_shas:
+                continue
+            target_path = VSCode.repo_to_user_path(user_folder, repo_path)
+            if target_path and os.path.isfile(target_path) and Files.file_blob_sha(target_path) == applied_sha:
+                os.remove(target_path)
+
+        Files.write_json(state_path, {repo_path: remote_shas[repo_path] for repo_path in targets})
+        Files.chown_like(written + [state_path], target)
+        Metrics.inc("ss_files_written_total", len(written))
+        print(f"Applied {len(written)} changed files to {target}.")
+
+    def fan_out(repo_owner: str, repo_name: str, remote_shas: dict, homes: list, offline: bool = False) -> None:
+        """
+        Apply a cached snapshot to many homes or VSCode data folders: the files of all of them
+        in parallel, then the missing extensions of each.
+        """
+        homes = [os.path.abspath(os.path.expanduser(home)) for home in homes]
 
-                # Download extensions-list.json to the user's desktop
-                download_file(extensions_url, extensions_target_path)
+        def apply(home):
+            try:
+                GitHub.apply_snapshot(repo_owner, repo_name, remote_shas, home)
+                return True
+            except (OSError, ValueError) as e:
+                print(f"Could not apply the settings to {home}: {e}")
+                Metrics.fail()
+                return False
+
+        with Profiler.phase("apply snapshot"):
+            with ThreadPoolExecutor(max_workers=Client.CONCURRENCY) as pool:
+                applied = dict(zip(homes, pool.map(apply, homes)))
+        lockfile_name = GitHub.lockfile_name(remote_shas)
+        if lockfile_name is None:
+            return
+
+        # One home after the other, so a package is downloaded once into the VSIX cache
+        # and the other homes install it from there
+        wanted, hashes = GitHub.locked_extensions(Snapshot.object_path(repo_owner, repo_name, remote_shas[lockfile_name]))
+        for home in (home for home in homes if applied[home]):
+            code_args = VSCode.code_args(home)
+            with Profiler.phase("code --list-extensions"):
+                installed = VSCode.list_installed_extensions(code_args)
+            if installed is None:
+                return
+            pending = GitHub.missing_extensions(wanted, installed)
+            if not pending:
+                print(f"All extensions are already installed in {home}.")
+                continue
+            with Profiler.phase("code --install-extension"):
+                failures = VSCode.install_extensions(pending, code_args=code_args, offline=offline, hashes=hashes)
+            print(f"Installed {len(pending) - len(failures)} of {len(pending)} extensions in {home}.")
+            for extension_id, error in failures.items():
+                print(f"Failed to install {extension_id} in {home}: {error}")
+            _, extensions_folder, _ = VSCode.target_paths(home)
+            Files.chown_like([
+                os.path.join(root, name) for root, dirs, names in os.walk(extensions_folder) for name in dirs + names
+            ], home)
+
+    def get_files_from_repo(homes: list = None, offline: bool = False) -> None:
+        """
+        Get setting files (settings.json, keybindings.json, snippets, profiles, tasks.json and the extensions list) from the repository.
 
-                # Download keybinds.json
-                download_file(keybinds_url, keybinds_target_path)
+        They are fetched into the local snapshot cache (see `Snapshot`) and applied from there.
+        `homes` applies them to those homes or VSCode data folders instead of this user's, and
+        `offline` applies the latest cached snapshot without contacting GitHub.
+        """
+        # Repository details, offline the identity cached by the last online run is used as is
+        try:
+            if offline:
+                repo_owner, repo_name = Variables.get_var("GH_LOGIN"), Variables.get_var("GH_REPO")
+            else:
+                repo_owner, repo_name = Client.identity()
+        except requests.exceptions.RequestException as e:
+            print(f"Error during file retrieval: {e}")
+            Metrics.fail()
+            return
+
+        def install_extensions_from_list(extension_list_path):
+            wanted, hashes = GitHub.locked_extensions(extension_list_path)
+
+            # Only install what is missing or older than the synced version. An interrupted
+            # run already worked that out, and only its unfinished installs are left.
+            pending = Journal.get("pending_extensions")
+            if pending is None:
+                with Profiler.phase("code --list-extensions"):
+                    installed = VSCode.list_installed_extensions()
+                if installed is None:
+                    return
+                pending = GitHub.missing_extensions(wanted, installed)
+                Journal.record("pending_extensions", pending)
+            done = Journal.get("installed_extensions", {})
+            pending = {extension_id: version for extension_id, version in pending.items() if extension_id not in done}
+            if not pending:
+                print("All extensions are already installed.")
+                return
+
+            with Profiler.phase("code --install-extension"):
+                failures = VSCode.install_extensions(
+                    pending, on_installed=lambda extension_id: Journal.add("installed_extensions", extension_id, True),
+                    offline=offline, hashes=hashes,
+                )
+            print(f"Installed {len(pending) - len(failures)} of {len(pending)} extensions.")
+            for extension_id, error in failures.items():
+                print(f"Failed to install {extension_id}: {error}")
 
-                # Install the VSCode extensions
-                install_extensions_from_list(extensions_target_path)            
+        try:
+            if offline:
+                remote_shas = Snapshot.load(repo_owner, repo_name) if repo_owner and repo_name else None
+                if remote_shas is None:
+                    print("No snapshot of the repository is cached yet, run `ss sync-get` once online first.")
+                    return
+                store = None
+            else:
+                # One listing of the remote tree tells which files differ
+                store = GitHub.storage(repo_owner, repo_name)
+                with Profiler.phase("list remote tree"):
+                    branch = store.default_branch(repo_owner, repo_name)
+                    remote_shas = store.list_remote_files(repo_owner, repo_name, branch)
+                remote_shas, bundled, archive_sha = GitHub.read_bundle(store, repo_owner, repo_name, remote_shas)
+                remote_shas = {repo_path: sha for repo_path, sha in remote_shas.items() if GitHub.is_synced_path(repo_path)}
+
+            # N homes cost one download into the cache and N local copies
+            if homes:
+                if store is not None:
+                    GitHub.fill_snapshot(store, repo_owner, repo_name, remote_shas, bundled, archive_sha)
+                GitHub.fan_out(repo_owner, repo_name, remote_shas, homes, offline=offline)
+                return
+
+            # Set the paths for the User folder and the extensions list
+            user_folder, _, lockfile_folder = VSCode.target_paths(str(Path.home()))
+            lockfile_name = GitHub.lockfile_name(remote_shas)
+            targets = {lockfile_name: os.path.join(lockfile_folder, lockfile_name)} if lockfile_name else {}
+            for repo_path in remote_shas if user_folder else ():
+                target_path = VSCode.repo_to_user_path(user_folder, repo_path)
+                if target_path is not None:
+                    targets[repo_path] = target_path
+
+            # A run interrupted on its way to the same remote state picks up where it stopped
+            Journal.begin(
+                "sync-get", Journal.target_of(remote_shas),
+                [os.getcwd()] + [os.path.dirname(target_path) for target_path in targets.values()],
+            )
+
+            with Profiler.phase("hash local files"):
+                local_shas = Files.hash_files({
+                    repo_path: target_path for repo_path, target_path in targets.items()
+                    if os.path.isfile(target_path)
+                })
+
+            # Files that already match are copied into the cache instead of being downloaded
+            if store is not None:
+                GitHub.fill_snapshot(store, repo_owner, repo_name, remote_shas, bundled, archive_sha, local_files={
+                    repo_path: targets[repo_path] for repo_path, sha in local_shas.items() if sha == remote_shas[repo_path]
+                })
+
+            # Only what differs is copied out of the cache
+            manifest = Files.read_json(GitHub.MANIFEST_PATH, {"files": {}})
+            synced = manifest["files"]
+            temp_paths = {}
+            with Profiler.phase("copy files from the snapshot cache"):
+                for repo_path, target_path in targets.items():
+                    if local_shas.get(repo_path) == remote_shas[repo_path]:
+                        continue
+                    # Local settings edits are kept as long as the remote copy has not moved since the last sync
+                    if Merge.is_mergeable(repo_path) and repo_path in local_shas and remote_shas[repo_path] == synced.get(repo_path):
+                        continue
+                    temp_paths[repo_path] = Snapshot.copy_to_temp(repo_owner, repo_name, remote_shas[repo_path], target_path)
+
+            for repo_path, temp_path in temp_paths.items():
+                edited = repo_path in local_shas and local_shas[repo_path] != synced.get(repo_path)
+                GitHub.apply_download(repo_path, temp_path, targets[repo_path], merge=edited)
+                print(f"File {'copied' if offline else 'downloaded'} successfully to {targets[repo_path]}")
+            Metrics.inc("ss_files_written_total", len(temp_paths))
+
+            # Remove User folder files that were synced before and are gone from the repository,
+            # unless they were changed locally since
+            for repo_path, synced_sha in synced.items():
+                if not VSCode.is_user_tree_path(repo_path) or repo_path in remote_shas:
+                    continue
+                target_path = VSCode.repo_to_user_path(user_folder, repo_path)
+                if target_path and os.path.isfile(target_path) and Files.file_blob_sha(target_path) == synced_sha:
+                    os.remove(target_path)
+                    print(f"File {target_path} removed, it was deleted from the repository.")
+
+            # Settings already in sync become the base of later merges
+            for repo_path, target_path in targets.items():
+                if Merge.is_mergeable(repo_path) and local_shas.get(repo_path) == remote_shas[repo_path] \
+                        and Merge.read_base(repo_path) is None:
+                    Merge.save_base(repo_path, target_path)
+
+            manifest["files"] = {repo_path: remote_shas[repo_path] for repo_path in targets}
+            Files.write_json(GitHub.MANIFEST_PATH, manifest)
+
+            # Install the VSCode extensions
+            if lockfile_name and os.path.exists(targets[lockfile_name]):
+                Lockfile.save_synced(targets[lockfile_name])
+                install_extensions_from_list(targets[lockfile_name])
+            Journal.finish()
+
+        except (requests.exceptions.RequestException, GitStore.Error, ValueError) as e:
+            print(f"Error during file retrieval: {e}")
+            Metrics.fail()
+
+        finally:
+            Journal.release()
+
+    def status() -> Union[bool, None]:
+        """
+        Compare the local files with the repository using one listing of the remote tree.
 
-            except requests.exceptions.RequestException as e:
-                print(f"Error during file retrieval: {e}")
+        Prints each file as added (only local), modified, identical or deleted (only in the
+        repository), and returns True when anything differs, or None when the repository
+        could not be reached.
+        """
+        files = GitHub.list_local_files()
+        extensions_file_path = os.path.abspath(Lockfile.NAME)
+        try:
+            with Profiler.phase("hash local files"):
+                local_shas = Files.hash_files(files)
+            repo_owner, repo_name = Client.identity()
+            store = GitHub.storage(repo_owner, repo_name)
+            with Profiler.phase("list remote tree"):
+                branch = store.default_branch(repo_owner, repo_name)
+                remote_shas = store.list_remote_files(repo_owner, repo_name, branch)
+                remote_shas, _, _ = GitHub.read_bundle(store, repo_owner, repo_name, remote_shas)
+        except (requests.exceptions.RequestException, GitStore.Error, ValueError) as e:
+            print(f"Error during status check: {e}")
+            Metrics.fail()
+            return None
+        finally:
+            if os.path.exists(extensions_file_path):
+                os.remove(extensions_file_path)
+
+        # Only files that a sync would transfer count, not e.g. the repository's README
+        remote_shas = {repo_path: sha for repo_path, sha in remote_shas.items() if GitHub.is_synced_path(repo_path)}
+        counts = {"added": 0, "modified": 0, "identical": 0, "deleted": 0}
+        for repo_path in sorted(set(local_shas) | set(remote_shas)):
+            if repo_path not in remote_shas:
+                state = "added"
+            elif repo_path not in local_shas:
+                state = "deleted"
+            else:
+                state = "identical" if local_shas[repo_path] == remote_shas[repo_path] else "modified"
+            counts[state] += 1
+            print(f"{state:<10} {repo_path}")
+        print(", ".join(f"{count} {state}" for state, count in counts.items()))
+        return counts["identical"] < sum(counts.values())
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from modules.files import Files
+
+
+class Journal:
+    """
+    Base class for the on-disk journal that lets an interrupted sync resume.
+
+    A sync starts the journal with the state it is moving to (its target). Completed
+    steps are recorded as they finish, so a re-run towards the same target skips them,
+    while a run towards a different target starts over. Either way, temp files left
+    behind by the interrupted run are removed first.
+
+    A sync holds an exclusive lock for as long as it runs, so two syncs sharing the
+    journal (e.g. `ss watch` and a manual `ss sync-get` in the same folder) run one
+    after the other. The OS releases the lock of a process that dies, so a journal
+    found on disk once the lock is taken always belongs to a run that is gone.
+    """
+    PATH = ".sync-journal.json"
+    LOCK_PATH = ".sync-journal.lock"
+    TEMP_PREFIXES = (".ss-",)  # Temp files of `Files.write_chunks_to_temp` and bundle builds
+
+    _lock = threading.Lock()
+    _lock_file = None
+    state = None
+
+    def target_of(data) -> str:
+        """Return a stable identifier of the state a sync moves to, from JSON-compatible `data`."""
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def begin(command: str, target: str, folders: list) -> bool:
+        """
+        Start or resume the journal of `command` moving to `target`.
+
+        `folders` are where the command may leave temp files. Waits for another sync
+        running in the same folder to finish first. Returns True when an interrupted
+        run towards the same target is being resumed.
+        """
+        Journal.acquire()
+        previous = Files.read_json(Journal.PATH, None)
+        folders = sorted(set(os.path.abspath(folder) for folder in folders))
+        if previous:
+            Journal.clean(set(previous.get("folders", [])) | set(folders))
+
+        resumed = bool(previous) and previous.get("command") == command and previous.get("target") == target
+        if resumed:
+            print(f"Resuming the interrupted {command}...")
+            previous["folders"] = sorted(set(previous.get("folders", [])) | set(folders))
+            Journal.state = previous
+        else:
+            Journal.state = {"command": command, "target": target, "folders": folders, "steps": {}}
+        Journal.state["owner"] = {"pid": os.getpid(), "host": socket.gethostname()}
+        Files.write_json(Journal.PATH, Journal.state)
+        return resumed
+
+    def acquire() -> None:
+        """Take the exclusive lock of the journal, waiting for the sync holding it to finish."""
+        if Journal._lock_file is not None:
+            return
+        lock_file = open(Journal.LOCK_PATH, "a+")
+        if not Journal.lock_file(lock_file, wait=False):
+            running = Files.read_json(Journal.PATH, None) or {}
+            owner = running.get("owner")
+            if owner:
+                print(f"Waiting for the {running.get('command', 'sync')} of pid {owner['pid']} on {owner['host']} to finish...")
+            else:
+                print("Waiting for another sync to finish...")
+            Journal.lock_file(lock_file, wait=True)
+        Journal._lock_file = lock_file
+
+    def lock_file(lock_file, wait: bool) -> bool:
+        """Lock an open file exclusively. Returns False when it is locked elsewhere and `wait` is false."""
+        if os.name == "nt":
+            import msvcrt
+
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                    return True
+                except OSError:
+                    if not wait:
+                        return False
+                    time.sleep(1)
+        import fcntl
+
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def release() -> None:
+        """
+        Let other syncs run, keeping the journal on disk when the sync did not finish, so it can be resumed.
+        """
+        Journal.state = None
+        if Journal._lock_file is not None:
+            Journal._lock_file.close()
+            Journal._lock_file = None
+
+    def clean(folders) -> None:
+        """Remove the temp files of an interrupted run."""
+        for folder in folders:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                if name.startswith(Journal.TEMP_PREFIXES):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+
+    def get(step: str, default=None):
+        """Return what was recorded for a step, or `default` when it has not completed (or no journal is open)."""
+        if Journal.state is None:
+            return default
+        return Journal.state["steps"].get(step, default)
+
+    def record(step: str, value) -> None:
+        """Record a completed step."""
+        if Journal.state is None:
+            return
+        with Journal._lock:
+            Journal.state["steps"][step] = value
+            Files.write_json(Journal.PATH, Journal.state)
+
+    def add(step: str, key: str, value) -> None:
+        """Record one completed item of a step made of many (e.g. one uploaded blob), safe to call from threads."""
+        if Journal.state is None:
+            return
+        with Journal._lock:
+            Journal.state["steps"].setdefault(step, {})[key] = value
+            Files.write_json(Journal.PATH, Journal.state)
+
+    def finish() -> None:
+        """Close the journal once the sync has completed."""
+        if os.path.exists(Journal.PATH):
+            os.remove(Journal.PATH)
+        Journal.release()
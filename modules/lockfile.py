@@ -0,0 +1,103 @@
+import json
+import urllib.parse
+from modules.files import Files
+
+
+class Lockfile:
+    """
+    Base class for the extensions lockfile.
+
+    The lockfile lists one `publisher.name@version` per line, sorted by ID, optionally
+    followed by the SHA-256 of the VSIX package, e.g.:
+
+        ms-python.python@2024.2.1 sha256:5f1c...
+        esbenp.prettier-vscode@10.1.0
+
+    The same extensions always produce the same file (and blob SHA). Readers also accept
+    the previous format, `extensions-list.json`, which is migrated as it is read.
+
+    A hash, once synced, stays locked to its version: it is never dropped or replaced
+    because of what happens to be in this machine's VSIX cache.
+    """
+    NAME = "extensions.lock"
+    LEGACY_NAME = "extensions-list.json"  # Marketplace metadata keyed by extension folder name
+    NAMES = (NAME, LEGACY_NAME)
+    SYNCED_PATH = ".sync-extensions.lock"  # Last synced lockfile, whose hashes are kept
+
+    def format(extensions: dict) -> str:
+        """
+        Render `{extension id: (version, sha256)}` as lockfile text. The version and the hash may be None.
+        """
+        lines = []
+        for extension_id in sorted(extensions, key=str.lower):
+            version, sha256 = extensions[extension_id]
+            line = f"{extension_id}@{version}" if version else extension_id
+            lines.append(f"{line} sha256:{sha256}" if sha256 else line)
+        return "".join(line + "\n" for line in lines)
+
+    def parse(text: str) -> dict:
+        """
+        Parse lockfile text, or the JSON of the previous format, into `{extension id: (version, sha256)}`.
+
+        Raises `ValueError` on a malformed line.
+        """
+        if text.lstrip().startswith("{"):
+            return Lockfile.parse_legacy(json.loads(text))
+        extensions = {}
+        for number, line in enumerate(text.splitlines(), 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            spec, _, digest = line.partition(" ")
+            extension_id, _, version = spec.partition("@")
+            digest = digest.strip()
+            if "." not in extension_id or (digest and not digest.startswith("sha256:")):
+                raise ValueError(f"Malformed lockfile line {number}: {line}")
+            extensions[extension_id] = (version or None, digest[len("sha256:"):] or None)
+        return extensions
+
+    def parse_legacy(data: dict) -> dict:
+        """
+        Convert the previous format, or the output of `VSCode.scan_extensions`, into `{extension id: (version, sha256)}`.
+        """
+        extensions = {}
+        for extension_info in data.values():
+            if "url" not in extension_info:
+                # The manifest of this extension could not be read
+                continue
+            extension_id = urllib.parse.unquote(extension_info["url"].split("itemName=")[-1])
+            version = extension_info.get("version")
+            extensions[extension_id] = (None if version in (None, "", "N/A") else version, None)
+        return extensions
+
+    def merge_hashes(extensions: dict, known: dict) -> dict:
+        """
+        Lock `extensions` to the hashes of `known` wherever both have the same version,
+        the others keep their own hash (or none).
+        """
+        merged = {}
+        for extension_id, (version, sha256) in extensions.items():
+            known_version, known_sha256 = known.get(extension_id, (None, None))
+            merged[extension_id] = (version, known_sha256 if known_sha256 and known_version == version else sha256)
+        return merged
+
+    def read_synced() -> dict:
+        """Return the last synced lockfile, empty when there is none or it cannot be parsed."""
+        try:
+            return Lockfile.read(Lockfile.SYNCED_PATH)
+        except (OSError, ValueError):
+            return {}
+
+    def save_synced(file_path: str) -> None:
+        """Record a lockfile, in either format, as the last synced one."""
+        with open(file_path, "rb") as file:
+            Files.write_bytes(Lockfile.SYNCED_PATH, file.read())
+
+    def read(file_path: str) -> dict:
+        """Read a lockfile, in either format, into `{extension id: (version, sha256)}`."""
+        with open(file_path, "r", encoding="utf-8") as file:
+            return Lockfile.parse(file.read())
+
+    def write(file_path: str, extensions: dict) -> None:
+        """Atomically write `{extension id: (version, sha256)}` as a lockfile."""
+        Files.write_bytes(file_path, Lockfile.format(extensions).encode("utf-8"))
@@ -0,0 +1,147 @@
+import json
+import re
+
+
+class Manifest:
+    """
+    Base class for streaming, field-selective reads of extension manifests (package.json).
+
+    Only the requested top-level keys are decoded. Every other value, such as a large
+    `contributes` section, is skipped while reading without building it in memory.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    # Everything up to the next bracket outside of a string, strings included
+    _FLAT = r'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*'
+    # Flat runs plus any innermost objects or arrays, so only deeper nesting is walked in Python
+    _SKIPPABLE = re.compile(rf'{_FLAT}(?:(?:\{{{_FLAT}\}}|\[{_FLAT}\]){_FLAT})*')
+    _STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+    _PRIMITIVE = re.compile(r'[^,}\]\s]*')
+    _WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, file):
+        self.file = file
+        self.buf = ""
+        self.pos = 0
+        self.mark = None  # Start of a value being captured, kept across refills
+        self.offset = 0  # Characters dropped from the front of the buffer
+
+    def read_fields(file_path: str, fields) -> dict:
+        """
+        Return `{key: value}` for the requested top-level `fields` of the JSON object in `file_path`.
+
+        Reading stops as soon as every requested field has been found.
+        Raises `json.JSONDecodeError` for malformed documents.
+        """
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
+            return Manifest(file)._read_object(set(fields))
+
+    def _fill(self) -> bool:
+        """Read the next chunk into the buffer, dropping what has been consumed."""
+        keep = self.pos if self.mark is None else self.mark
+        if keep:
+            self.buf = self.buf[keep:]
+            self.offset += keep
+            self.pos -= keep
+            if self.mark is not None:
+                self.mark = 0
+        chunk = self.file.read(Manifest.CHUNK_SIZE)
+        self.buf += chunk
+        return bool(chunk)
+
+    def _error(self, message: str):
+        return json.JSONDecodeError(message, "", self.offset + self.pos)
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it ("" at EOF)."""
+        while True:
+            self.pos = Manifest._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def _skip_string(self) -> None:
+        """Skip a string whose opening quote has already been consumed."""
+        while True:
+            self.pos = Manifest._STRING_BODY.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            if not self._fill():
+                raise self._error("Unterminated string")
+
+    def _skip_value(self) -> None:
+        """Skip one JSON value of any type."""
+        char = self._peek()
+        if not char:
+            raise self._error("Expecting value")
+        if char == '"':
+            self.pos += 1
+            self._skip_string()
+        elif char in "{[":
+            self.pos += 1
+            depth = 1
+            while True:
+                self.pos = Manifest._SKIPPABLE.match(self.buf, self.pos).end()
+                if self.pos == len(self.buf):
+                    if not self._fill():
+                        raise self._error("Unterminated object or array")
+                    continue
+                token = self.buf[self.pos]
+                self.pos += 1
+                if token == '"':
+                    # A string running past the end of the buffer
+                    self._skip_string()
+                elif token in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+        else:
+            while True:
+                self.pos = Manifest._PRIMITIVE.match(self.buf, self.pos).end()
+                if self.pos < len(self.buf) or not self._fill():
+                    return
+
+    def _read_value(self):
+        """Decode one JSON value."""
+        self._peek()
+        self.mark = self.pos
+        try:
+            self._skip_value()
+            text = self.buf[self.mark:self.pos]
+        finally:
+            self.mark = None
+        return json.loads(text)
+
+    def _read_object(self, fields: set) -> dict:
+        if self._peek() == "\ufeff":
+            self.pos += 1
+        self._expect("{")
+        found = {}
+        if self._peek() == "}":
+            return found
+        while True:
+            if self._peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self._read_value()
+            self._expect(":")
+            if key in fields and key not in found:
+                found[key] = self._read_value()
+                if len(found) == len(fields):
+                    return found
+            else:
+                self._skip_value()
+            separator = self._peek()
+            self.pos += 1
+            if separator == "}":
+                return found
+            if separator != ",":
+                raise self._error("Expecting ',' delimiter")
@@ -0,0 +1,174 @@
+import json
+import os
+import re
+from modules.files import Files
+
+
+class Merge:
+    """
+    Base class for three-way merges of JSONC settings files (settings.json).
+
+    The last synced version of each file is kept as a base snapshot. Top-level keys
+    changed on only one side since then are taken from that side, keys changed on
+    both sides are reported as conflicts and keep the local value. Edits are patched
+    into the local text, so comments and formatting outside the changed keys survive.
+    """
+    BASE_FOLDER = ".sync-base"  # Last synced version of each mergeable file, by repository path
+
+    _COMMENT = re.compile(r'"(?:[^"\\\n]|\\.)*"|//[^\n]*|/\*[\s\S]*?\*/')
+    _TRAILING_COMMA = re.compile(r'"(?:[^"\\\n]|\\.)*"|,(?=\s*[}\]])')
+    _WHITESPACE = re.compile(r'\s*')
+    _MISSING = object()
+
+    def is_mergeable(repo_path: str) -> bool:
+        """
+        Tell whether a synced file is merged key by key instead of being overwritten.
+        """
+        return os.path.basename(repo_path) == "settings.json"
+
+    def read_base(repo_path: str):
+        """
+        Return the text of the base snapshot of a file, or None when there is none yet.
+        """
+        try:
+            with open(os.path.join(Merge.BASE_FOLDER, repo_path), "r", encoding="utf-8") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def save_base(repo_path: str, file_path: str) -> None:
+        """
+        Record the content of `file_path` as the base snapshot of `repo_path`.
+        """
+        with open(file_path, "rb") as file:
+            Files.write_bytes(os.path.join(Merge.BASE_FOLDER, repo_path), file.read())
+
+    def strip(text: str, trailing_commas: bool = True) -> str:
+        """
+        Blank out comments, and trailing commas unless told otherwise, so `text` parses as plain JSON.
+
+        Offsets are preserved, so positions found in the result also apply to `text`.
+        """
+        def blank(match):
+            token = match.group()
+            return token if token.startswith('"') else re.sub(r'[^\n]', ' ', token)
+
+        text = Merge._COMMENT.sub(blank, text)
+        return Merge._TRAILING_COMMA.sub(blank, text) if trailing_commas else text
+
+    def members(text: str) -> dict:
+        """
+        Locate the top-level members of the JSONC object in `text`.
+
+        Returns `{key: (member start, value start, value end, end)}`, where `end` is past the
+        member's comma when it has one. Raises `ValueError` when `text` is not a JSONC object.
+        """
+        plain = Merge.strip(text)
+        # Trailing commas still count as the end of a member
+        uncommented = Merge.strip(text, trailing_commas=False)
+        decoder = json.JSONDecoder()
+
+        def skip(pos):
+            return Merge._WHITESPACE.match(plain, pos).end()
+
+        pos = skip(0)
+        if plain[pos:pos + 1] != "{":
+            raise ValueError("Settings file is not a JSON object")
+        members = {}
+        pos = skip(pos + 1)
+        while plain[pos:pos + 1] != "}":
+            key_start = pos
+            key, pos = decoder.raw_decode(plain, pos)
+            pos = skip(pos)
+            if not isinstance(key, str) or plain[pos:pos + 1] != ":":
+                raise ValueError(f"Malformed member at offset {key_start}")
+            value_start = skip(pos + 1)
+            _, value_end = decoder.raw_decode(plain, value_start)
+            pos = Merge._WHITESPACE.match(uncommented, value_end).end()
+            end = value_end
+            if uncommented[pos:pos + 1] == ",":
+                end = pos + 1
+                pos = skip(end)
+            elif plain[pos:pos + 1] != "}":
+                raise ValueError(f"Expected ',' or '}}' at offset {pos}")
+            members[key] = (key_start, value_start, value_end, end)
+        if plain[skip(pos + 1):]:
+            raise ValueError(f"Unexpected content after the settings object at offset {pos + 1}")
+        return members
+
+    def values(text: str, members: dict) -> dict:
+        """Decode the value of each member, so formatting differences do not count as changes."""
+        plain = Merge.strip(text)
+        return {key: json.dumps(json.loads(plain[span[1]:span[2]]), sort_keys=True) for key, span in members.items()}
+
+    def merge(base: str, local: str, remote: str) -> tuple:
+        """
+        Merge the changes between `base` and `remote` into `local`.
+
+        Returns `(merged text, conflicting keys)`. Raises `ValueError` when a file is not a JSONC object.
+        """
+        base_members, local_members, remote_members = Merge.members(base), Merge.members(local), Merge.members(remote)
+        base_values = Merge.values(base, base_members)
+        local_values = Merge.values(local, local_members)
+        remote_values = Merge.values(remote, remote_members)
+
+        plain = Merge.strip(local)
+        patches, inserts, deleted, conflicts = [], [], set(), []
+        for key in list(local_members) + [key for key in remote_members if key not in local_members]:
+            base_value = base_values.get(key, Merge._MISSING)
+            local_value = local_values.get(key, Merge._MISSING)
+            remote_value = remote_values.get(key, Merge._MISSING)
+            if remote_value == base_value or remote_value == local_value:
+                continue
+            if local_value != base_value:
+                conflicts.append(key)
+                continue
+
+            if remote_value is Merge._MISSING:
+                key_start, _, _, end = local_members[key]
+                # Take the whole line, trailing comment included, when the member is alone on it
+                line_start = local.rfind("\n", 0, key_start) + 1
+                line_end = local.find("\n", end)
+                line_end = len(local) if line_end == -1 else line_end + 1
+                if not plain[line_start:key_start].strip() and not plain[end:line_end].strip():
+                    key_start, end = line_start, line_end
+                patches.append((key_start, end, ""))
+                deleted.add(key)
+            else:
+                _, value_start, value_end, _ = remote_members[key]
+                value_text = remote[value_start:value_end]
+                if local_value is Merge._MISSING:
+                    inserts.append(f"{json.dumps(key)}: {value_text}")
+                else:
+                    _, local_start, local_end, _ = local_members[key]
+                    patches.append((local_start, local_end, value_text))
+
+        if inserts:
+            newline = "\r\n" if "\r\n" in local else "\n"
+            kept = [span for key, span in local_members.items() if key not in deleted]
+            indent = "    "
+            if local_members:
+                first_start = min(span[0] for span in local_members.values())
+                line_start = local.rfind("\n", 0, first_start) + 1
+                if not local[line_start:first_start].strip():
+                    indent = local[line_start:first_start]
+            if kept:
+                _, _, value_end, position = max(kept)
+                prefix = "," if position == value_end else ""
+                # New members go after a trailing comment on the last line, not before it
+                line_end = plain.find("\n", position)
+                if line_end != -1 and not plain[position:line_end].strip():
+                    line_end = line_end - 1 if local[line_end - 1] == "\r" else line_end
+                    if prefix and line_end > position:
+                        patches.append((position, position, prefix))
+                        prefix = ""
+                    position = line_end
+                suffix = ""
+            else:
+                position, prefix, suffix = plain.index("{") + 1, "", newline
+            patches.append((position, position, prefix + ",".join(newline + indent + member for member in inserts) + suffix))
+
+        merged = local
+        for start, end, replacement in sorted(patches, reverse=True):
+            merged = merged[:start] + replacement + merged[end:]
+        return merged, conflicts
@@ -0,0 +1,275 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from modules.files import Files
+from modules.scheduler import Scheduler
+from modules.variables import Variables
+
+
+class Metrics:
+    """
+    Base class for the operational metrics of syncs, for monitoring many machines.
+
+    Counters and histograms are recorded during a sync (`Metrics.run`) and written when it ends:
+    - `ss.prom`, a Prometheus textfile-collector file with the totals of all runs so far and
+      gauges of the last one, replaced atomically, and
+    - `history.jsonl`, one JSON line per run, summarized by `ss stats`.
+    Set in the `.env` file:
+    - `SS_METRICS=false` to turn them off
+    - `SS_METRICS_DIR`: folder of the history and totals, `~/.cache/ss/metrics` by default
+    - `SS_METRICS_TEXTFILE`: path of the `.prom` file, e.g. in node_exporter's `--collector.textfile.directory`
+    """
+    HISTORY_NAME = "history.jsonl"
+    TOTALS_NAME = "totals.json"  # Totals of all runs, the textfile is rendered from it
+    TEXTFILE_NAME = "ss.prom"
+    HISTORY_MAX_BYTES = 4 * 1024 * 1024  # The older half of the history is dropped above this size
+    BUCKETS = {
+        "ss_sync_duration_seconds": (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+        "ss_http_request_duration_seconds": (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    }
+    HELP = {
+        "ss_syncs_total": ("counter", "Syncs run, by command and result."),
+        "ss_sync_duration_seconds": ("histogram", "Wall time of syncs, by command."),
+        "ss_http_requests_total": ("counter", "GitHub API requests, by endpoint and status (0 when no response was received)."),
+        "ss_http_request_duration_seconds": ("histogram", "Duration of GitHub API requests, by endpoint."),
+        "ss_http_retries_total": ("counter", "GitHub API requests retried after an error or a rate limit."),
+        "ss_http_rate_limited_total": ("counter", "GitHub API requests rejected by a rate limit."),
+        "ss_http_throttled_seconds_total": ("counter", "Seconds spent waiting to stay within the rate limit."),
+        "ss_files_uploaded_total": ("counter", "Files pushed to the repository."),
+        "ss_files_deleted_total": ("counter", "Files deleted from the repository."),
+        "ss_files_downloaded_total": ("counter", "Blobs downloaded from the repository into the snapshot cache."),
+        "ss_files_written_total": ("counter", "Files written to the User folder, the Desktop or other homes."),
+        "ss_extension_installs_total": ("counter", "Extension installs, by result."),
+        "ss_github_rate_limit_remaining": ("gauge", "Requests left in the GitHub rate limit window after the last sync."),
+        "ss_github_rate_limit_reset_timestamp_seconds": ("gauge", "When the GitHub rate limit window of the last sync resets."),
+        "ss_last_sync_timestamp_seconds": ("gauge", "When the last sync of each command ended."),
+        "ss_last_sync_duration_seconds": ("gauge", "Wall time of the last sync of each command."),
+        "ss_last_sync_success": ("gauge", "Whether the last sync of each command succeeded (1) or not (0)."),
+    }
+    # Totals of the retry/rate-limit accounting of `Scheduler`, exported per run
+    SCHEDULER_COUNTERS = {
+        "retries": "ss_http_retries_total",
+        "rate_limited": "ss_http_rate_limited_total",
+        "throttled_seconds": "ss_http_throttled_seconds_total",
+    }
+
+    _lock = threading.Lock()
+    counters = {}
+    histograms = {}
+    failed = False
+
+    def enabled() -> bool:
+        return Variables.get_var("SS_METRICS") != "false"
+
+    def folder() -> str:
+        """Return the folder of the history and totals."""
+        return Variables.get_var("SS_METRICS_DIR") or os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache"), "ss", "metrics"
+        )
+
+    def series(name: str, labels: dict) -> str:
+        """Return the Prometheus series name, e.g. `ss_syncs_total{command="sync-get",result="success"}`."""
+        if not labels:
+            return name
+        escaped = {
+            key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            for key, value in labels.items()
+        }
+        return name + "{" + ",".join(f'{key}="{value}"' for key, value in sorted(escaped.items())) + "}"
+
+    def inc(name: str, value: float = 1, **labels) -> None:
+        """Add `value` to a counter."""
+        key = Metrics.series(name, labels)
+        with Metrics._lock:
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + value
+
+    def observe(name: str, value: float, **labels) -> None:
+        """Record a value in a histogram, see `BUCKETS`."""
+        key = Metrics.series(name, labels)
+        with Metrics._lock:
+            histogram = Metrics.histograms.setdefault(
+                key, {"buckets": [0] * len(Metrics.BUCKETS[name]), "sum": 0.0, "count": 0}
+            )
+            for index, bound in enumerate(Metrics.BUCKETS[name]):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def fail() -> None:
+        """Mark the current sync as failed, called where errors are reported."""
+        Metrics.failed = True
+
+    @contextmanager
+    def run(command: str):
+        """
+        Record the metrics of one sync, e.g. `with Metrics.run("sync-send"):`, and write them when it ends.
+        """
+        with Metrics._lock:
+            Metrics.counters, Metrics.histograms, Metrics.failed = {}, {}, False
+            scheduler_start = dict(Scheduler.stats)
+        started = time.time()
+        clock = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            Metrics.failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - clock
+            result = "failure" if Metrics.failed else "success"
+            Metrics.inc("ss_syncs_total", command=command, result=result)
+            Metrics.observe("ss_sync_duration_seconds", duration, command=command)
+            for stat, name in Metrics.SCHEDULER_COUNTERS.items():
+                delta = Scheduler.stats[stat] - scheduler_start[stat]
+                if delta:
+                    Metrics.inc(name, delta)
+            if Metrics.enabled():
+                try:
+                    Metrics.write(command, started, duration, result)
+                except OSError as e:
+                    print(f"Could not write the sync metrics: {e}")
+
+    def write(command: str, started: float, duration: float, result: str) -> None:
+        """
+        Add the current run to the totals, rewrite the textfile and append the run to the history.
+        """
+        folder = Metrics.folder()
+        totals_path = os.path.join(folder, Metrics.TOTALS_NAME)
+        totals = Files.read_json(totals_path, {"counters": {}, "histograms": {}, "gauges": {}})
+        for key, value in Metrics.counters.items():
+            totals["counters"][key] = totals["counters"].get(key, 0) + value
+        for key, histogram in Metrics.histograms.items():
+            total = totals["histograms"].setdefault(key, {"buckets": [0] * len(histogram["buckets"]), "sum": 0.0, "count": 0})
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+            total["sum"] += histogram["sum"]
+            total["count"] += histogram["count"]
+
+        gauges = totals["gauges"]
+        gauges[Metrics.series("ss_last_sync_timestamp_seconds", {"command": command})] = round(started + duration, 3)
+        gauges[Metrics.series("ss_last_sync_duration_seconds", {"command": command})] = round(duration, 3)
+        gauges[Metrics.series("ss_last_sync_success", {"command": command})] = int(result == "success")
+        if Scheduler.remaining is not None:
+            gauges["ss_github_rate_limit_remaining"] = Scheduler.remaining
+        if Scheduler.reset is not None:
+            gauges["ss_github_rate_limit_reset_timestamp_seconds"] = Scheduler.reset
+        Files.write_json(totals_path, totals)
+        textfile_path = Variables.get_var("SS_METRICS_TEXTFILE") or os.path.join(folder, Metrics.TEXTFILE_NAME)
+        Files.write_bytes(textfile_path, Metrics.render(totals).encode("utf-8"))
+
+        record = {
+            "time": round(started, 3),
+            "host": socket.gethostname(),
+            "command": command,
+            "result": result,
+            "duration": round(duration, 3),
+            "counters": Metrics.counters,
+            "rate_limit_remaining": Scheduler.remaining,
+        }
+        history_path = os.path.join(folder, Metrics.HISTORY_NAME)
+        # One write per line, so runs appending at the same time do not interleave
+        with open(history_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, sort_keys=True) + "\n")
+        if os.path.getsize(history_path) > Metrics.HISTORY_MAX_BYTES:
+            runs = Metrics.read_history()
+            kept = runs[len(runs) // 2:]
+            Files.write_bytes(history_path, "".join(json.dumps(run, sort_keys=True) + "\n" for run in kept).encode("utf-8"))
+
+    def render(totals: dict) -> str:
+        """Render totals in the Prometheus text exposition format."""
+        by_name = {}
+        for kind in ("counters", "gauges", "histograms"):
+            for key, value in totals[kind].items():
+                by_name.setdefault(key.split("{", 1)[0], []).append((key, value))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text = Metrics.HELP.get(name, ("untyped", name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            for key, value in sorted(by_name[name]):
+                if metric_type != "histogram":
+                    lines.append(f"{key} {value:g}")
+                    continue
+                labels = key[len(name) + 1:-1] if "{" in key else ""
+                prefix = labels + "," if labels else ""
+                for bound, count in zip(Metrics.BUCKETS[name], value["buckets"]):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value["count"]}')
+                suffix = "{" + labels + "}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {value['sum']:g}")
+                lines.append(f"{name}_count{suffix} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def read_history(days: float = None) -> list:
+        """Return the recorded runs, only those of the last `days` days when given."""
+        cutoff = time.time() - days * 24 * 60 * 60 if days is not None else 0
+        runs = []
+        try:
+            with open(os.path.join(Metrics.folder(), Metrics.HISTORY_NAME), "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        run = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    if run["time"] >= cutoff:
+                        runs.append(run)
+        except OSError:
+            pass
+        return runs
+
+    def percentile(values: list, share: float) -> float:
+        """Return the value below which `share` of the sorted `values` fall."""
+        return values[min(len(values) - 1, int(share * len(values)))]
+
+    def summary(days: float = None) -> None:
+        """
+        Print per-command figures of the recorded runs: failures, durations, API usage,
+        rate-limit headroom and extension install failures.
+        """
+        runs = Metrics.read_history(days)
+        if not runs:
+            print("No syncs recorded yet." if days is None else f"No syncs recorded in the last {days:g} days.")
+            return
+
+        def total(run, name):
+            return sum(value for key, value in run["counters"].items() if key.split("{", 1)[0] == name)
+
+        print(f"{len(runs)} runs since {datetime.fromtimestamp(runs[0]['time']):%Y-%m-%d %H:%M}\n")
+        print("Command     runs  failed    p50 (s)    p95 (s)    max (s)  requests/run  retries  rate limited")
+        for command in sorted(set(run["command"] for run in runs)):
+            selected = [run for run in runs if run["command"] == command]
+            durations = sorted(run["duration"] for run in selected)
+            failed = sum(run["result"] != "success" for run in selected)
+            requests = sum(total(run, "ss_http_requests_total") for run in selected)
+            print(
+                f"{command:<10} {len(selected):>5} {failed:>7} {Metrics.percentile(durations, 0.5):>10.2f}"
+                f" {Metrics.percentile(durations, 0.95):>10.2f} {durations[-1]:>10.2f} {requests / len(selected):>13.1f}"
+                f" {sum(total(run, 'ss_http_retries_total') for run in selected):>8g}"
+                f" {sum(total(run, 'ss_http_rate_limited_total') for run in selected):>13g}"
+            )
+
+        remaining = [run for run in runs if run.get("rate_limit_remaining") is not None]
+        if remaining:
+            lowest = min(remaining, key=lambda run: run["rate_limit_remaining"])
+            print(
+                f"\nRate limit: {remaining[-1]['rate_limit_remaining']} requests left after the last run,"
+                f" lowest {lowest['rate_limit_remaining']} ({datetime.fromtimestamp(lowest['time']):%Y-%m-%d %H:%M})."
+            )
+        installs = {
+            result: sum(value for run in runs for key, value in run["counters"].items()
+                        if key == Metrics.series("ss_extension_installs_total", {"result": result}))
+            for result in ("success", "failure")
+        }
+        if sum(installs.values()):
+            print(
+                f"Extension installs: {installs['failure']:g} of {sum(installs.values()):g} failed"
+                f" ({installs['failure'] * 100 / sum(installs.values()):.1f}%)."
+            )
+        last = runs[-1]
+        print(f"Last run: {last['command']} {last['result']} at {datetime.fromtimestamp(last['time']):%Y-%m-%d %H:%M} on {last['host']}.")
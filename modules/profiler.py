@@ -0,0 +1,143 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Base class for per-phase timing and HTTP accounting of a CLI command.
+
+    Disabled unless `start` is called (`--profile` / `--trace`), in which case phases
+    and HTTP calls are recorded and written out by `stop`.
+    """
+    enabled = False
+    trace_path = None
+    profile_path = None
+
+    _lock = threading.Lock()
+    _origin = 0.0
+    _events = []
+    _phases = {}
+    _endpoints = {}
+    _cprofile = None
+
+    def start(trace_path: str = None, profile_path: str = None) -> None:
+        """
+        Start recording. `trace_path` receives a Chrome trace timeline, `profile_path` a cProfile dump.
+        """
+        Profiler.enabled = True
+        Profiler.trace_path = trace_path
+        Profiler.profile_path = profile_path
+        Profiler._origin = time.perf_counter()
+        if profile_path:
+            Profiler._cprofile = cProfile.Profile()
+            Profiler._cprofile.enable()
+
+    def _now_us() -> float:
+        return (time.perf_counter() - Profiler._origin) * 1_000_000
+
+    def _add_event(name: str, category: str, start_us: float, duration_us: float, args: dict = None) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start_us, 1),
+            "dur": round(duration_us, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with Profiler._lock:
+            Profiler._events.append(event)
+
+    @contextmanager
+    def phase(name: str):
+        """
+        Time a phase of a command, e.g. `with Profiler.phase("extract_extensions_info"):`.
+        """
+        if not Profiler.enabled:
+            yield
+            return
+        start = Profiler._now_us()
+        try:
+            yield
+        finally:
+            duration = Profiler._now_us() - start
+            Profiler._add_event(name, "phase", start, duration)
+            with Profiler._lock:
+                calls, total = Profiler._phases.get(name, (0, 0.0))
+                Profiler._phases[name] = (calls + 1, total + duration)
+
+    def endpoint(method: str, url: str) -> str:
+        """
+        Collapse a URL into an endpoint label like `GET /repos/:owner/:repo/contents/:path`.
+        """
+        path = re.sub(r"^https?://[^/]+", "", url.split("?", 1)[0])
+        path = re.sub(r"^/repos/[^/]+/[^/]+", "/repos/:owner/:repo", path)
+        path = re.sub(r"/contents/.*", "/contents/:path", path)
+        path = re.sub(r"/(blobs|trees|commits)/[^/]+$", r"/\1/:sha", path)
+        path = re.sub(r"/(branches|ref|refs)/.*", r"/\1/:name", path)
+        return f"{method.upper()} {path}"
+
+    def record_http(method: str, url: str, status: int, sent: int, received: int, start_us: float) -> None:
+        """
+        Record one HTTP call with the bytes sent and received.
+        """
+        if not Profiler.enabled:
+            return
+        label = Profiler.endpoint(method, url)
+        Profiler._add_event(label, "http", start_us, Profiler._now_us() - start_us, {
+            "status": status, "sent": sent, "received": received,
+        })
+        with Profiler._lock:
+            stats = Profiler._endpoints.setdefault(label, {"calls": 0, "sent": 0, "received": 0})
+            stats["calls"] += 1
+            stats["sent"] += sent
+            stats["received"] += received
+
+    def now() -> float:
+        """
+        Return a start timestamp for `record_http`.
+        """
+        return Profiler._now_us() if Profiler.enabled else 0.0
+
+    def summary() -> dict:
+        with Profiler._lock:
+            return {
+                "phases": {
+                    name: {"calls": calls, "total_ms": round(total / 1000, 1)}
+                    for name, (calls, total) in Profiler._phases.items()
+                },
+                "endpoints": {label: dict(stats) for label, stats in Profiler._endpoints.items()},
+            }
+
+    def stop() -> None:
+        """
+        Stop recording, write the trace and cProfile files and print a summary to stderr.
+        """
+        if not Profiler.enabled:
+            return
+        Profiler.enabled = False
+        if Profiler._cprofile is not None:
+            Profiler._cprofile.disable()
+            Profiler._cprofile.dump_stats(Profiler.profile_path)
+            print(f"cProfile data written to {Profiler.profile_path}", file=sys.stderr)
+
+        summary = Profiler.summary()
+        if Profiler.trace_path:
+            with open(Profiler.trace_path, "w", encoding="utf-8") as trace_file:
+                json.dump({"traceEvents": Profiler._events, "otherData": summary}, trace_file, indent=1)
+            print(f"Trace written to {Profiler.trace_path} (open it in chrome://tracing or Perfetto)", file=sys.stderr)
+
+        print("\nPhase                              calls   total (ms)", file=sys.stderr)
+        for name, stats in sorted(summary["phases"].items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"{name:<34} {stats['calls']:>5} {stats['total_ms']:>12}", file=sys.stderr)
+        print("\nEndpoint                                            calls       sent   received", file=sys.stderr)
+        for label, stats in sorted(summary["endpoints"].items()):
+            print(f"{label:<50} {stats['calls']:>6} {stats['sent']:>10} {stats['received']:>10}", file=sys.stderr)
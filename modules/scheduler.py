@@ -0,0 +1,150 @@
+import email.utils
+import random
+import threading
+import time
+from datetime import timezone
+from typing import Union
+
+
+class Scheduler:
+    """
+    Base class for rate-limit-aware pacing and retrying of GitHub API requests.
+
+    Every response is fed to `observe`, which tracks `X-RateLimit-Remaining/Reset`
+    and `Retry-After`. `wait` is called before every request and sleeps when the
+    remaining quota is running low, spreading what is left until the reset time.
+    """
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+    RETRY_STATUSES = (500, 502, 503, 504)
+    PACE_THRESHOLD = 50  # Start spreading requests out below this many remaining calls
+    MAX_WAIT = 300  # Longest single sleep in seconds, for the pacer and for Retry-After
+    MAX_RETRIES = 4  # Retries per request
+    RETRY_BUDGET = 20  # Retries per CLI invocation, or per sync of `ss watch`
+    BACKOFF_BASE = 0.5  # Seconds
+    BACKOFF_CAP = 30  # Seconds
+
+    _lock = threading.Lock()
+    remaining = None
+    reset = None
+    retry_after_until = 0.0
+    budget = RETRY_BUDGET
+    stats = {
+        "requests": 0,
+        "retries": 0,
+        "throttled": 0,
+        "throttled_seconds": 0.0,
+        "rate_limited": 0,
+        "server_errors": 0,
+        "connection_errors": 0,
+    }
+
+    def renew_budget() -> None:
+        """
+        Give the next sync the full retry budget, for processes running many (`ss watch`).
+        """
+        with Scheduler._lock:
+            Scheduler.budget = Scheduler.RETRY_BUDGET
+
+    def _sleep(seconds: float) -> None:
+        seconds = min(seconds, Scheduler.MAX_WAIT)
+        if seconds > 0:
+            with Scheduler._lock:
+                Scheduler.stats["throttled"] += 1
+                Scheduler.stats["throttled_seconds"] += seconds
+            time.sleep(seconds)
+
+    def wait() -> None:
+        """
+        Sleep as needed before sending a request to stay within the rate limit.
+        """
+        now = time.time()
+        with Scheduler._lock:
+            Scheduler.stats["requests"] += 1
+            delay = Scheduler.retry_after_until - now
+            if Scheduler.remaining is not None and Scheduler.reset is not None and Scheduler.reset > now:
+                if Scheduler.remaining <= 0:
+                    delay = max(delay, Scheduler.reset - now)
+                elif Scheduler.remaining < Scheduler.PACE_THRESHOLD:
+                    delay = max(delay, (Scheduler.reset - now) / Scheduler.remaining)
+                Scheduler.remaining -= 1
+        Scheduler._sleep(delay)
+
+    def observe(response) -> None:
+        """
+        Record the rate-limit headers of a response.
+        """
+        headers = response.headers
+        with Scheduler._lock:
+            if "X-RateLimit-Remaining" in headers:
+                Scheduler.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                Scheduler.reset = int(headers["X-RateLimit-Reset"])
+            retry_after = Scheduler.parse_retry_after(headers.get("Retry-After"))
+            if retry_after is not None:
+                Scheduler.retry_after_until = time.time() + retry_after
+            if Scheduler.is_rate_limited(response):
+                Scheduler.stats["rate_limited"] += 1
+            elif response.status_code in Scheduler.RETRY_STATUSES:
+                Scheduler.stats["server_errors"] += 1
+
+    def parse_retry_after(value: str) -> Union[float, None]:
+        """
+        Return the seconds to wait from a `Retry-After` header, given in seconds or as an HTTP date,
+        or None when there is none or it cannot be parsed (the normal backoff applies then).
+        """
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, when.timestamp() - time.time())
+
+    def is_rate_limited(response) -> bool:
+        """
+        Tell whether a response was rejected by the primary or secondary rate limit.
+        """
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def retry_delay(method: str, attempt: int, response=None, error: Exception = None) -> Union[float, None]:
+        """
+        Return how long to wait before retrying, or None when the request should not be retried.
+
+        Rate-limited requests are never processed by GitHub, so they are retried whatever
+        the method. Server errors and connection errors are only retried for idempotent methods.
+        """
+        if response is not None and Scheduler.is_rate_limited(response):
+            # `wait` already sleeps until Retry-After or the reset time, give up if that is too far away
+            blocked_until = Scheduler.retry_after_until
+            if Scheduler.remaining == 0 and Scheduler.reset is not None:
+                blocked_until = max(blocked_until, Scheduler.reset)
+            blocked_for = blocked_until - time.time()
+            if blocked_for > Scheduler.MAX_WAIT:
+                return None
+            # Without a usable reset time (e.g. clock skew), back off for at least a second
+            delay = 0.0 if blocked_for > 0 else 1 + random.uniform(0, min(Scheduler.BACKOFF_CAP, Scheduler.BACKOFF_BASE * 2 ** attempt))
+        elif method.upper() in Scheduler.IDEMPOTENT_METHODS and (
+            error is not None or (response is not None and response.status_code in Scheduler.RETRY_STATUSES)
+        ):
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(Scheduler.BACKOFF_CAP, Scheduler.BACKOFF_BASE * 2 ** attempt))
+        else:
+            return None
+
+        with Scheduler._lock:
+            if attempt >= Scheduler.MAX_RETRIES or Scheduler.budget <= 0:
+                return None
+            Scheduler.budget -= 1
+            Scheduler.stats["retries"] += 1
+            if error is not None:
+                Scheduler.stats["connection_errors"] += 1
+        return delay
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Union
+from modules.files import Files
+from modules.variables import Variables
+
+
+class Snapshot:
+    """
+    Base class for the local cache of repository snapshots used by `sync-get`.
+
+    File contents are stored once by blob SHA under `objects/`, and each fetched state
+    of the repository is a version listing `{repository path: sha}` under `versions/`,
+    the newest one being named in `latest`. A snapshot fetched once can then be applied
+    to any number of homes, or again later without network access.
+    The cache is set in the `.env` file:
+    - `SS_SNAPSHOT_CACHE`: cache folder, `~/.cache/ss/snapshots` by default
+    - `SS_SNAPSHOT_KEEP`: number of versions kept, older ones and their unused objects are pruned
+    """
+    KEEP = 5
+    PRUNE_GRACE = 10 * 60  # Seconds an object is safe from pruning after use, so other processes sharing the cache can finish with it
+
+    def folder(repo_owner: str, repo_name: str) -> str:
+        """Return the cache folder of a repository."""
+        cache_folder = Variables.get_var("SS_SNAPSHOT_CACHE") or os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache"), "ss", "snapshots"
+        )
+        return os.path.join(cache_folder, repo_owner, repo_name)
+
+    def object_path(repo_owner: str, repo_name: str, sha: str) -> str:
+        """Return the cache path of a blob."""
+        return os.path.join(Snapshot.folder(repo_owner, repo_name), "objects", sha[:2], sha[2:])
+
+    def has(repo_owner: str, repo_name: str, sha: str) -> bool:
+        """Tell whether a blob is cached, marking it as recently used."""
+        object_path = Snapshot.object_path(repo_owner, repo_name, sha)
+        try:
+            os.utime(object_path)
+            return True
+        except OSError:
+            return False
+
+    def add(repo_owner: str, repo_name: str, sha: str, temp_path: str) -> None:
+        """Move a temp file already verified to hold blob `sha` into the cache."""
+        os.replace(temp_path, Snapshot.object_path(repo_owner, repo_name, sha))
+
+    def add_file(repo_owner: str, repo_name: str, sha: str, file_path: str) -> None:
+        """Copy a local file already known to hold blob `sha` into the cache."""
+        object_path = Snapshot.object_path(repo_owner, repo_name, sha)
+        with open(file_path, "rb") as source:
+            temp_path = Files.write_chunks_to_temp(object_path, iter(lambda: source.read(1024 * 1024), b""))
+        Snapshot.add(repo_owner, repo_name, sha, temp_path)
+
+    def copy_to_temp(repo_owner: str, repo_name: str, sha: str, target_path: str) -> str:
+        """
+        Copy a cached blob to a temp file next to `target_path`, leaving the swap to the caller.
+
+        Returns the temp file path.
+        """
+        with open(Snapshot.object_path(repo_owner, repo_name, sha), "rb") as source:
+            return Files.write_chunks_to_temp(target_path, iter(lambda: source.read(1024 * 1024), b""))
+
+    def save(repo_owner: str, repo_name: str, files: dict) -> str:
+        """
+        Record `{repository path: sha}` as the latest version, once all its blobs are cached.
+
+        Returns the version, an identifier of the files' content.
+        """
+        folder = Snapshot.folder(repo_owner, repo_name)
+        version = hashlib.sha1(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+        Files.write_json(os.path.join(folder, "versions", f"{version}.json"), {"files": files, "created": int(time.time())})
+        Files.write_bytes(os.path.join(folder, "latest"), version.encode("ascii"))
+        Snapshot.prune(repo_owner, repo_name)
+        return version
+
+    def load(repo_owner: str, repo_name: str, version: str = None) -> Union[dict, None]:
+        """
+        Return the files `{repository path: sha}` of a version (the latest by default),
+        or None when it is not in the cache or some of its blobs are missing.
+        """
+        folder = Snapshot.folder(repo_owner, repo_name)
+        if version is None:
+            try:
+                with open(os.path.join(folder, "latest"), "r", encoding="ascii") as file:
+                    version = file.read().strip()
+            except OSError:
+                return None
+        snapshot = Files.read_json(os.path.join(folder, "versions", f"{version}.json"))
+        if snapshot is None or not all(Snapshot.has(repo_owner, repo_name, sha) for sha in snapshot["files"].values()):
+            return None
+        return snapshot["files"]
+
+    def prune(repo_owner: str, repo_name: str, keep: int = None) -> None:
+        """
+        Remove all but the `keep` newest versions, and the objects no remaining version uses.
+        """
+        if keep is None:
+            keep = int(Variables.get_var("SS_SNAPSHOT_KEEP") or Snapshot.KEEP)
+        folder = Snapshot.folder(repo_owner, repo_name)
+        versions_folder = os.path.join(folder, "versions")
+        try:
+            entries = [entry for entry in os.scandir(versions_folder) if entry.name.endswith(".json")]
+        except OSError:
+            return
+
+        versions = {entry.path: Files.read_json(entry.path) for entry in entries}
+        newest = sorted(
+            (path for path, snapshot in versions.items() if snapshot),
+            key=lambda path: versions[path]["created"], reverse=True,
+        )
+        used = set()
+        for path in newest[:keep]:
+            used.update(versions[path]["files"].values())
+        for path in set(versions) - set(newest[:keep]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        # Temp files of interrupted downloads are pruned along with unused objects
+        cutoff = time.time() - Snapshot.PRUNE_GRACE
+        for root, _, names in os.walk(os.path.join(folder, "objects")):
+            for name in names:
+                object_path = os.path.join(root, name)
+                if os.path.basename(root) + name in used:
+                    continue
+                try:
+                    if os.stat(object_path).st_mtime < cutoff:
+                        os.remove(object_path)
+                except OSError:
+                    # Already pruned by another process sharing the cache
+                    pass
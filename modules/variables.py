@@ -1,3 +1,6 @@
+import os
+
+
 class Variables:
     """
     Base class for Environment Variable-related actions.
@@ -6,15 +9,25 @@ class Variables:
         """
         Get the value of a variable from the `.env` file.
         """
+        if not os.path.exists(".env"):
+            return None
         with open(".env", "r") as env_file:
             for line in env_file:
-                if var_name.upper() + "=" in line:
-                    value = line.split('=')[1].strip()
+                if line.startswith(var_name.upper() + "="):
+                    value = line.split('=', 1)[1].strip()
                     return value
 
     def put_var(var_name: str, var_value: str) -> str:
         """
-        Put a variable inside the .env` file.
+        Put a variable inside the .env` file, keeping the other variables intact.
         """
+        lines = []
+        if os.path.exists(".env"):
+            with open(".env", "r") as env_file:
+                lines = [
+                    line for line in env_file
+                    if not line.startswith(var_name.upper() + "=")
+                ]
+        lines.append(f"{var_name.upper()}={var_value}\n")
         with open(".env", "w") as env_file:
-            env_file.write(f"{var_name.upper()}={var_value}\n")
+            env_file.writelines(lines)
@@ -1,79 +1,160 @@
 import json
 import os
-import requests
-from typing import Union
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from modules.files import Files
+from modules.manifest import Manifest
+from typing import Callable, Union
 
 class VSCode:
     """
     Base class for VSCode-related actions.
     """
+    EXTENSIONS_INDEX_PATH = ".extensions-index.json"  # Parsed manifests keyed by folder path and mtime
+    MANIFEST_FIELDS = ("publisher", "name", "version", "description", "repository", "categories")
+    # Repository path -> User folder file name of the files synced from the start
+    USER_FILES = {"settings.json": "settings.json", "keybinds.json": "keybindings.json"}
+    # The rest of the User folder tree that is synced as-is
+    USER_TREE_FILES = ("tasks.json",)
+    USER_TREE_FOLDERS = ("snippets", "profiles")
+    USER_TREE_EXCLUDE = ("globalStorage", "workspaceStorage", "History", "sync", "logs")
+
     def validate_github_token(gh_token: str) -> bool:
         """
         Validate a GitHub Access Token.
         """
 
-        # Set the API endpoint and headers
-        url = "https://api.github.com/user"
+        # Imported here so the other VSCode actions do not pay for loading requests
+        import requests
+        from modules.client import Client
+
+        # Set the headers for the token being validated
         headers = {"Authorization": f"token {gh_token}"}
 
         # Make the request
         try:
-            response = requests.get(url, headers=headers)
+            response = Client.get("/user", headers=headers)
             response.raise_for_status()
+            # Cache the identity so the sync commands can skip /user
+            Client.remember_identity(response.json()["login"])
             return True
         except requests.exceptions.RequestException as e:
             print(f"Error validating GitHub Token: {e}")
             return False
 
 
-    def locate_settings_file() -> Union[str, None]:
-        """Locate the settings.json file and return it's contents."""
-        # Default settings folder locations for different operating systems
+    def default_user_folder(home: str = None) -> Union[str, None]:
+        """Return where VSCode's User folder lives on this platform, whether it exists or not, for the current user or under `home`."""
+        if home is None:
+            home = os.path.expanduser("~")
+            appdata = os.environ.get("APPDATA", "")
+        else:
+            appdata = os.path.join(home, "AppData", "Roaming")
+        # Default User folder locations for different operating systems
         default_folders = {
-            "darwin": os.path.expanduser("~/Library/Application Support/Code/User"),
-            "linux": os.path.expanduser("~/.config/Code/User"),
-            "win32": os.path.join(os.environ.get("APPDATA", ""), "Code", "User"),
+            "darwin": os.path.join(home, "Library", "Application Support", "Code", "User"),
+            "linux": os.path.join(home, ".config", "Code", "User"),
+            "win32": os.path.join(appdata, "Code", "User"),
         }
         # Get the user's platform
-        platform = os.sys.platform
-        # Check if the platform is in the default_folders dictionary
-        if platform in default_folders:
-            vscode_settings_folder = default_folders[platform]
-            # Check if the settings folder exists
-            if os.path.exists(vscode_settings_folder):
-                settings_file_path = os.path.join(
-                    vscode_settings_folder, "settings.json"
-                )
-                # Check if settings.json exists
-                if os.path.exists(settings_file_path):
-                    with open(settings_file_path) as settings_file:
-                        content = settings_file.read()
-                    return content
+        return default_folders.get(os.sys.platform)
+
+    def is_data_folder(target: str) -> bool:
+        """Tell whether a sync target is a VSCode data folder (`--user-data-dir`, or a portable `data` folder) rather than a home."""
+        return os.path.isdir(os.path.join(target, "User"))
+
+    def target_paths(target: str) -> tuple:
+        """
+        Return `(User folder, extensions folder, folder of the extensions lockfile)` of a sync target,
+        a home or a VSCode data folder.
+        """
+        if VSCode.is_data_folder(target):
+            return os.path.join(target, "User"), os.path.join(target, "extensions"), target
+        return (
+            VSCode.default_user_folder(target),
+            os.path.join(target, ".vscode", "extensions"),
+            os.path.join(target, "Desktop"),
+        )
+
+    def locate_user_folder() -> Union[str, None]:
+        """Locate VSCode's User folder (where settings.json and keybindings.json live)."""
+        vscode_user_folder = VSCode.default_user_folder()
+        # Check if the folder exists
+        if vscode_user_folder is not None and os.path.exists(vscode_user_folder):
+            return vscode_user_folder
         return None
-        
+
+    def is_user_tree_path(repo_path: str) -> bool:
+        """Tell whether a repository path belongs to the synced User folder tree (snippets, profiles, tasks)."""
+        return repo_path in VSCode.USER_TREE_FILES or repo_path.split("/", 1)[0] in VSCode.USER_TREE_FOLDERS
+
+    def repo_to_user_path(user_folder: str, repo_path: str) -> Union[str, None]:
+        """Map a repository path to its location in the User folder, or None if it is not part of it."""
+        if repo_path in VSCode.USER_FILES:
+            return os.path.join(user_folder, VSCode.USER_FILES[repo_path])
+        if not VSCode.is_user_tree_path(repo_path):
+            return None
+        parts = repo_path.split("/")
+        if ".." in parts or any(VSCode.is_excluded(part) for part in parts):
+            return None
+        return os.path.join(user_folder, *parts)
+
+    def is_excluded(name: str) -> bool:
+        """Machine-local state inside the User folder tree that must not be synced."""
+        return name in VSCode.USER_TREE_EXCLUDE or name.startswith(".") or ".vscdb" in name
+
+    def list_user_files(user_folder: str) -> dict:
+        """
+        List the synced files of the User folder as `{repository path: local path}`:
+        settings.json, keybindings.json (as keybinds.json), tasks.json, snippets/ and profiles/.
+        """
+        files = {}
+        for repo_path, file_name in VSCode.USER_FILES.items():
+            file_path = os.path.join(user_folder, file_name)
+            if os.path.isfile(file_path):
+                files[repo_path] = file_path
+        for file_name in VSCode.USER_TREE_FILES:
+            file_path = os.path.join(user_folder, file_name)
+            if os.path.isfile(file_path):
+                files[file_name] = file_path
+        for folder in VSCode.USER_TREE_FOLDERS:
+            for root, dirs, names in os.walk(os.path.join(user_folder, folder)):
+                dirs[:] = [name for name in dirs if not VSCode.is_excluded(name)]
+                for name in names:
+                    if not VSCode.is_excluded(name):
+                        file_path = os.path.join(root, name)
+                        files[os.path.relpath(file_path, user_folder).replace(os.sep, "/")] = file_path
+        return files
+
+    def locate_user_file(file_name: str) -> Union[str, None]:
+        """Return the path of a file in VSCode's User folder, if it exists."""
+        vscode_user_folder = VSCode.locate_user_folder()
+        if vscode_user_folder is not None:
+            file_path = os.path.join(vscode_user_folder, file_name)
+            if os.path.exists(file_path):
+                return file_path
+        return None
+
+    def locate_settings_file() -> Union[str, None]:
+        """Locate the settings.json file and return it's contents."""
+        settings_file_path = VSCode.locate_user_file("settings.json")
+        # Check if settings.json exists
+        if settings_file_path is not None:
+            with open(settings_file_path) as settings_file:
+                content = settings_file.read()
+            return content
+        return None
+
     def locate_keybinds_file() -> Union[str, None]:
         """Locate the keybindings.json and return it's contents."""
-        # Default keybinds folder locations for different operating systems
-        default_folders = {
-            "darwin": os.path.expanduser("~/Library/Application Support/Code/User"),
-            "linux": os.path.expanduser("~/.config/Code/User"),
-            "win32": os.path.join(os.environ.get("APPDATA", ""), "Code/User"),
-        }
-        # Get the user's platform
-        platform = os.sys.platform
-        # Check if the platform is in the default_folders dictionary
-        if platform in default_folders:
-            vscode_keybinds_folder = default_folders[platform]
-            # Check if the settings folder exists
-            if os.path.exists(vscode_keybinds_folder):
-                keybinds_file_path = os.path.join(
-                    vscode_keybinds_folder, "keybindings.json"
-                )
-                # Check if settings.json exists
-                if os.path.exists(keybinds_file_path):
-                    with open(keybinds_file_path) as settings_file:
-                        content = settings_file.read()
-                    return content
+        keybinds_file_path = VSCode.locate_user_file("keybindings.json")
+        # Check if keybindings.json exists
+        if keybinds_file_path is not None:
+            with open(keybinds_file_path) as keybinds_file:
+                content = keybinds_file.read()
+            return content
         return None
 
     def get_extension_info(extension_path: str) -> dict:
@@ -81,39 +162,37 @@ class VSCode:
         fields_file_path = os.path.join(extension_path, "package.json")
         try:
             if os.path.exists(fields_file_path):
-                with open(
-                    fields_file_path, "r", encoding="utf-8", errors="ignore"
-                ) as fields_file:
-                    try:
-                        fields_data = json.load(fields_file)
-                        # Combine publisher and name to form the extension ID
-                        extension_id = f"{fields_data.get('publisher', 'N/A')}.{fields_data.get('name', 'N/A')}"
-                        # Check the type of the 'repository' field
-                        if isinstance(fields_data.get("repository"), dict):
-                            repo_url = fields_data["repository"].get("url", "N/A")
-                        else:
-                            repo_url = fields_data.get("repository", "N/A")
-                        return {
-                            # I want the url key to have the url of the extension's page on vscode marketplace. I just need to know how I can get the extension identifier 
+                try:
+                    # Only decode the fields we need, skipping large sections like `contributes`
+                    fields_data = Manifest.read_fields(fields_file_path, VSCode.MANIFEST_FIELDS)
+                    # Combine publisher and name to form the extension ID
+                    extension_id = f"{fields_data.get('publisher', 'N/A')}.{fields_data.get('name', 'N/A')}"
+                    # Check the type of the 'repository' field
+                    if isinstance(fields_data.get("repository"), dict):
+                        repo_url = fields_data["repository"].get("url", "N/A")
+                    else:
+                        repo_url = fields_data.get("repository", "N/A")
+                    return {
+                        # I want the url key to have the url of the extension's page on vscode marketplace. I just need to know how I can get the extension identifier 
                             
-                            "url": f"https://marketplace.visualstudio.com/items?itemName={extension_id}",
-                            "version": fields_data.get("version", "N/A"),
-                            "publisher": fields_data.get("publisher", "N/A"),
-                            "description": fields_data.get("description", "N/A"),
-                            "repository": repo_url,
-                            "categories": fields_data.get("categories", []),
-                        }
-                    except json.JSONDecodeError as json_error:
-                        print(
-                            f"Error decoding JSON in {fields_file_path}: {json_error}"
-                        )
-                        return {
-                            "version": "N/A",
-                            "publisher": "N/A",
-                            "description": "N/A",
-                            "repository": "N/A",
-                            "categories": [],
-                        }
+                        "url": f"https://marketplace.visualstudio.com/items?itemName={extension_id}",
+                        "version": fields_data.get("version", "N/A"),
+                        "publisher": fields_data.get("publisher", "N/A"),
+                        "description": fields_data.get("description", "N/A"),
+                        "repository": repo_url,
+                        "categories": fields_data.get("categories", []),
+                    }
+                except json.JSONDecodeError as json_error:
+                    print(
+                        f"Error decoding JSON in {fields_file_path}: {json_error}"
+                    )
+                    return {
+                        "version": "N/A",
+                        "publisher": "N/A",
+                        "description": "N/A",
+                        "repository": "N/A",
+                        "categories": [],
+                    }
             else:
                 return {
                     "version": "N/A",
@@ -132,34 +211,183 @@ class VSCode:
                 "categories": [],
             }
             
+    def scan_extensions(extensions_folder: str, max_workers: int = 8) -> dict:
+        """
+        Scan the extensions folder and return `{folder name: extension info}` for the active
+        version of every extension.
+
+        Manifests are parsed in a thread pool, and results are reused from an on-disk index
+        keyed by folder path while the `package.json` mtime is unchanged.
+        """
+        index = Files.read_json(VSCode.EXTENSIONS_INDEX_PATH, {})
+        # Folders VS Code has uninstalled or replaced but not yet deleted
+        obsolete = Files.read_json(os.path.join(extensions_folder, ".obsolete"), {})
+
+        def scan(entry: os.DirEntry) -> tuple:
+            try:
+                mtime = os.stat(os.path.join(entry.path, "package.json")).st_mtime_ns
+            except OSError:
+                mtime = None
+            cached = index.get(entry.path)
+            if cached and cached["mtime"] == mtime:
+                return entry, mtime, cached["info"]
+            return entry, mtime, VSCode.get_extension_info(entry.path)
+
+        entries = [
+            entry for entry in os.scandir(extensions_folder)
+            if entry.is_dir() and entry.name not in obsolete
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(scan, entries))
+
+        # Keep only the newest version of each extension ID
+        active = {}
+        new_index = {}
+        for entry, mtime, info in results:
+            new_index[entry.path] = {"mtime": mtime, "info": info}
+            extension_id = info.get("url", entry.name).split("itemName=")[-1].lower()
+            current = active.get(extension_id)
+            if current is None or VSCode.parse_version(info["version"]) > VSCode.parse_version(current[1]["version"]):
+                active[extension_id] = (entry.name, info)
+
+        if new_index != index:
+            Files.write_json(VSCode.EXTENSIONS_INDEX_PATH, new_index)
+
+        return {folder: info for folder, info in active.values()}
+
     def extract_extensions_info() -> None:
-        """Extract the User's extensions and save them to the script's dir (extensions-list.json)"""
+        """
+        Extract the User's extensions and save them to the script's dir as a lockfile (extensions.lock).
+
+        Extensions keep the hash of the last synced lockfile, the others are locked to the
+        hash of their package when it is in the VSIX cache.
+        """
+        from modules.lockfile import Lockfile
+        from modules.vsix import VSIXCache
+
         extensions_folder = os.path.join(
             os.environ["HOME"], ".vscode", "extensions"
         )
         try:
             if os.path.exists(extensions_folder):
-                extensions_info = {}
-                for extension_folder in os.listdir(extensions_folder):
-                    extension_path = os.path.join(extensions_folder, extension_folder)
-                    # Check if the entry in the folder is a directory (extension)
-                    if os.path.isdir(extension_path):
-                        extension_info = VSCode.get_extension_info(
-                            extension_path
-                        )
-                        extensions_info[extension_folder] = extension_info
-                # Output the extensions information to extensions-list.json
-                with open(
-                    "extensions-list.json", "w", encoding="utf-8"
-                ) as extensions_file:
-                    json.dump(
-                        extensions_info, extensions_file, indent=2, ensure_ascii=False
-                    )
+                extensions = Lockfile.parse_legacy(VSCode.scan_extensions(extensions_folder))
+                extensions = Lockfile.merge_hashes({
+                    extension_id: (version, VSIXCache.digest(extension_id, version) if version else None)
+                    for extension_id, (version, _) in extensions.items()
+                }, Lockfile.read_synced())
+                Lockfile.write(Lockfile.NAME, extensions)
                 print(
-                    "Extensions information gathered and saved to extensions-list.json."
+                    f"Extensions information gathered and saved to {Lockfile.NAME}."
                 )
             else:
                 print("Error: Extensions folder not found.")
         except Exception as e:
             print(f"Error extracting extensions information: {e}")
 
+    def parse_version(version: str) -> tuple:
+        """Turn a version string like `1.2.3` into a comparable tuple, ignoring non-numeric parts."""
+        return tuple(int(part) for part in re.findall(r"\d+", str(version).split("-")[0]))
+
+    def code_args(target: str) -> list:
+        """Return the `code` CLI options that point it at the data and extensions folders of a sync target."""
+        user_folder, extensions_folder, _ = VSCode.target_paths(target)
+        return ["--user-data-dir", os.path.dirname(user_folder), "--extensions-dir", extensions_folder]
+
+    def list_installed_extensions(code_args: list = ()) -> Union[dict, None]:
+        """Return the installed extensions as `{lowercase id: version}` using the `code` CLI."""
+        code = shutil.which("code")
+        if code is None:
+            print("Error: The `code` command was not found, make sure it is on your PATH.")
+            return None
+        result = subprocess.run(
+            [code, *code_args, "--list-extensions", "--show-versions"], capture_output=True, text=True
+        )
+        installed = {}
+        for line in result.stdout.splitlines():
+            extension_id, _, version = line.strip().partition("@")
+            if extension_id:
+                installed[extension_id.lower()] = version
+        return installed
+
+    def install_extensions(extensions: dict, max_workers: int = 4, on_installed: Callable = None, code_args: list = (),
+                           offline: bool = False, hashes: dict = None) -> dict:
+        """
+        Install `{extension id: version}`, fetching the packages `max_workers` at a time and
+        installing them with one `code` process.
+
+        Packages come from the local VSIX cache when possible, see `VSIXCache`.
+        `on_installed` is called with the ID of each extension once it is installed.
+        `code_args` are passed to each `code` process, see `VSCode.code_args`.
+        `offline` only installs from the cache, as does `SS_VSIX_OFFLINE=true` in the `.env` file.
+        `hashes` holds the SHA-256 the packages of some extensions must match, see `Lockfile`.
+        Returns `{extension id: error message}` for every extension that failed to install.
+        """
+        from modules.vsix import VSIXCache
+
+        code = shutil.which("code")
+        if code is None:
+            return {extension_id: "`code` command not found" for extension_id in extensions}
+        offline = offline or VSIXCache.offline()
+
+        def fetch(item: tuple) -> tuple:
+            """Return `(id@version, cached package or None, error)` for one extension."""
+            extension_id, version = item
+            target = extension_id if version in (None, "", "N/A") else f"{extension_id}@{version}"
+            sha256 = (hashes or {}).get(extension_id)
+            try:
+                source = VSIXCache.fetch(extension_id, version, offline, sha256) if target != extension_id else None
+            except OSError as e:
+                return target, None, str(e)
+            if source is None and offline:
+                return target, None, "not in the VSIX cache (offline mode)"
+            if source is None and sha256:
+                return target, None, "no package matching the locked hash"
+            return target, source, None
+
+        def run_code(installs: list) -> Union[str, None]:
+            """Install packages or `id@version`s with one `code` process, returning the error if it fails."""
+            args = [code, *code_args]
+            for install in installs:
+                args += ["--install-extension", install]
+            try:
+                result = subprocess.run(args + ["--force"], capture_output=True, text=True)
+            except OSError as e:
+                return str(e)
+            if result.returncode != 0:
+                return (result.stderr or result.stdout).strip() or f"exit code {result.returncode}"
+            return None
+
+        def installed(extension_id: str) -> None:
+            target, source = ready[extension_id]
+            print(f"Installed {target}" + (" from the VSIX cache" if source else ""))
+            if on_installed:
+                on_installed(extension_id)
+
+        from modules.metrics import Metrics
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            fetched = dict(zip(extensions, pool.map(fetch, extensions.items())))
+        failures = {extension_id: error for extension_id, (_, _, error) in fetched.items() if error}
+        ready = {extension_id: (target, source) for extension_id, (target, source, error) in fetched.items() if not error}
+
+        # Concurrent `code` processes would race on the extensions folder's registry (extensions.json)
+        # and lose entries, so one process installs the whole batch
+        error = run_code([source or target for target, source in ready.values()]) if ready else None
+        if error is None:
+            for extension_id in ready:
+                installed(extension_id)
+        elif len(ready) == 1:
+            failures.update(dict.fromkeys(ready, error))
+        else:
+            # Tell which ones failed, one process after the other
+            for extension_id, (target, source) in ready.items():
+                error = run_code([source or target])
+                if error:
+                    failures[extension_id] = error
+                else:
+                    installed(extension_id)
+
+        Metrics.inc("ss_extension_installs_total", len(extensions) - len(failures), result="success")
+        Metrics.inc("ss_extension_installs_total", len(failures), result="failure")
+        VSIXCache.evict()
+        return failures
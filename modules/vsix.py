@@ -0,0 +1,139 @@
+import hashlib
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Union
+import requests
+from modules.client import Client
+from modules.files import Files
+from modules.variables import Variables
+
+
+class VSIXCache:
+    """
+    Base class for the local VSIX cache used by extension installs.
+
+    Packages are stored as `<publisher.name>@<version>.vsix`, which names their content
+    exactly, so the folder can be shared between machines (e.g. on a network mount).
+    The folder, its size limit and offline mode are set in the `.env` file:
+    - `SS_VSIX_CACHE`: cache folder, `~/.cache/ss/vsix` by default
+    - `SS_VSIX_CACHE_MB`: size above which the least recently used packages are evicted
+    - `SS_VSIX_OFFLINE=true`: only install from the cache, never download
+    """
+    MARKETPLACE_URL = os.environ.get("SS_MARKETPLACE_URL", "https://marketplace.visualstudio.com")  # Overridable for local testing
+    MAX_SIZE_MB = 2048
+    EVICTION_GRACE = 10 * 60  # Seconds a package is safe from eviction after use, so other machines can finish installing it
+
+    def folder() -> str:
+        """Return the cache folder."""
+        return Variables.get_var("SS_VSIX_CACHE") or os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache"), "ss", "vsix"
+        )
+
+    def offline() -> bool:
+        """Tell whether installs must be served from the cache alone."""
+        return Variables.get_var("SS_VSIX_OFFLINE") == "true"
+
+    def path(extension_id: str, version: str) -> str:
+        """Return the cache path of a package."""
+        return os.path.join(VSIXCache.folder(), f"{extension_id.lower()}@{version}.vsix")
+
+    def digest(extension_id: str, version: str) -> Union[str, None]:
+        """
+        Return the SHA-256 of the cached package of `extension_id@version`, or None when it is not cached.
+
+        The hash is computed once and kept next to the package, installs verify the package itself.
+        """
+        vsix_path = VSIXCache.path(extension_id, version)
+        if not os.path.isfile(vsix_path):
+            return None
+        try:
+            with open(vsix_path + ".sha256", "r", encoding="ascii") as file:
+                return file.read().strip()
+        except OSError:
+            pass
+        try:
+            sha256 = VSIXCache.digest_file(vsix_path)
+        except OSError:
+            return None
+        Files.write_bytes(vsix_path + ".sha256", sha256.encode("ascii"))
+        return sha256
+
+    def digest_file(file_path: str) -> str:
+        """Compute the SHA-256 of a file."""
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def fetch(extension_id: str, version: str, offline: bool = False, sha256: str = None) -> Union[str, None]:
+        """
+        Return the path of the cached package of `extension_id@version`, downloading it from the marketplace on a miss.
+
+        With `sha256`, a package with a different hash is not used, and a cached one is downloaded again.
+        Returns None on a miss in offline mode, or when the download fails.
+        """
+        vsix_path = VSIXCache.path(extension_id, version)
+        if os.path.isfile(vsix_path):
+            if sha256 is None or VSIXCache.digest_file(vsix_path) == sha256:
+                # Mark it as recently used for the eviction
+                os.utime(vsix_path)
+                return vsix_path
+            print(f"The cached package of {extension_id}@{version} does not match the lockfile, downloading it again.")
+            VSIXCache.remove(vsix_path)
+        if offline:
+            return None
+
+        publisher, _, name = extension_id.partition(".")
+        url = f"{VSIXCache.MARKETPLACE_URL}/_apis/public/gallery/publishers/{publisher}/vsextensions/{name}/{version}/vspackage"
+        try:
+            # Not sent through `Client`, the GitHub token must not reach the marketplace
+            with requests.get(url, stream=True, timeout=Client.TIMEOUT) as response:
+                response.raise_for_status()
+                temp_path = Files.write_chunks_to_temp(vsix_path, response.iter_content(256 * 1024))
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"Could not download {extension_id}@{version} into the VSIX cache: {e}")
+            return None
+
+        # Only complete packages are moved into the cache
+        if not zipfile.is_zipfile(temp_path):
+            os.remove(temp_path)
+            print(f"The marketplace did not return a valid package for {extension_id}@{version}")
+            return None
+        if sha256 is not None and VSIXCache.digest_file(temp_path) != sha256:
+            os.remove(temp_path)
+            print(f"The marketplace package of {extension_id}@{version} does not match the lockfile hash")
+            return None
+        os.replace(temp_path, vsix_path)
+        return vsix_path
+
+    def remove(vsix_path: str) -> None:
+        """Remove a cached package and its hash."""
+        for file_path in (vsix_path, vsix_path + ".sha256"):
+            try:
+                os.remove(file_path)
+            except OSError:
+                # Already evicted by another machine sharing the cache
+                pass
+
+    def evict(max_size_mb: int = None) -> None:
+        """
+        Remove the least recently used packages until the cache fits in its size limit.
+        """
+        if max_size_mb is None:
+            max_size_mb = int(Variables.get_var("SS_VSIX_CACHE_MB") or VSIXCache.MAX_SIZE_MB)
+        try:
+            entries = [entry for entry in os.scandir(VSIXCache.folder()) if entry.name.endswith(".vsix")]
+        except OSError:
+            return
+
+        stats = {entry.path: entry.stat() for entry in entries}
+        total = sum(stat.st_size for stat in stats.values())
+        cutoff = time.time() - VSIXCache.EVICTION_GRACE
+        for vsix_path, stat in sorted(stats.items(), key=lambda item: item[1].st_mtime):
+            if total <= max_size_mb * 1024 * 1024 or stat.st_mtime > cutoff:
+                break
+            VSIXCache.remove(vsix_path)
+            total -= stat.st_size
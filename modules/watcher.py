@@ -0,0 +1,178 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+
+class Watcher:
+    """
+    Base class for watching VSCode's settings and pushing changes automatically.
+
+    Uses inotify on Linux and falls back to polling modification times elsewhere.
+    Bursts of events are coalesced: `callback` runs on a background worker once
+    nothing has changed for `debounce` seconds. The watcher only keeps a flag and
+    a timestamp between runs, so memory stays flat however long it is up.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+    def __init__(self, folders: dict, callback, debounce: float = 5.0, poll_interval: float = 2.0,
+                 trees: list = (), exclude=None):
+        """
+        `folders` maps each folder to watch to the file names that matter in it, or None for any entry.
+        `trees` are folders watched with all their subfolders, including the ones created later,
+        except for the names `exclude` returns True for.
+        """
+        self.folders = {folder: names for folder, names in folders.items() if folder and os.path.isdir(folder)}
+        self.trees = [tree for tree in trees if tree]
+        self.exclude = exclude or (lambda name: False)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        self.last_change = 0.0
+
+    def relevant(self, folder: str, name: str) -> bool:
+        # Ignore the temp files written by atomic saves, including our own
+        if not name or name.startswith(".ss-") or name.endswith((".tmp", "~")):
+            return False
+        if self.in_tree(folder):
+            return not self.exclude(name)
+        names = self.folders.get(folder)
+        return names is None or name in names
+
+    def in_tree(self, path: str) -> bool:
+        return any(path == tree or path.startswith(tree + os.sep) for tree in self.trees)
+
+    def tree_folders(self, tree: str) -> list:
+        """A watched tree's folder and subfolders, leaving out the excluded ones."""
+        folders = []
+        for root, dirs, _ in os.walk(tree):
+            dirs[:] = [name for name in dirs if not self.exclude(name)]
+            folders.append(root)
+        return folders
+
+    def mark_changed(self) -> None:
+        self.last_change = time.monotonic()
+        self.changed.set()
+
+    def worker(self) -> None:
+        """Run the callback once changes have settled for the debounce window."""
+        while not self.stopped.is_set():
+            if not self.changed.wait(timeout=1.0):
+                continue
+            quiet_for = time.monotonic() - self.last_change
+            if quiet_for < self.debounce:
+                self.stopped.wait(self.debounce - quiet_for)
+                continue
+            self.changed.clear()
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"Error while pushing changes: {e}")
+
+    def watch_inotify(self) -> bool:
+        """Block on inotify events. Returns False when inotify is unavailable."""
+        libc_name = ctypes.util.find_library("c")
+        if not os.sys.platform.startswith("linux") or libc_name is None:
+            return False
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        fd = libc.inotify_init1(Watcher.IN_NONBLOCK | Watcher.IN_CLOEXEC)
+        if fd < 0:
+            return False
+        try:
+            descriptors = {}
+
+            def add_watch(folder):
+                wd = libc.inotify_add_watch(fd, os.fsencode(folder), Watcher.WATCH_MASK)
+                if wd >= 0:
+                    descriptors[wd] = folder
+
+            for folder in self.folders:
+                add_watch(folder)
+            for tree in self.trees:
+                for folder in self.tree_folders(tree):
+                    add_watch(folder)
+            if not descriptors:
+                return False
+
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([fd], [], [], 1.0)
+                if not readable:
+                    continue
+                data = os.read(fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, length = Watcher.EVENT_HEADER.unpack_from(data, offset)
+                    offset += Watcher.EVENT_HEADER.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                    offset += length
+                    folder = descriptors.get(wd)
+                    if mask & Watcher.IN_Q_OVERFLOW or (folder and self.relevant(folder, name)):
+                        self.mark_changed()
+                    # inotify is not recursive, folders created in a tree (e.g. a new profile) get their own watches
+                    if folder and mask & Watcher.IN_ISDIR and mask & (Watcher.IN_CREATE | Watcher.IN_MOVED_TO):
+                        path = os.path.join(folder, name)
+                        if self.in_tree(path) and not self.exclude(name):
+                            for subfolder in self.tree_folders(path):
+                                add_watch(subfolder)
+            return True
+        finally:
+            os.close(fd)
+
+    def snapshot(self) -> dict:
+        """Modification times of the relevant entries, for the polling fallback."""
+        state = {}
+        for folder in list(self.folders) + [folder for tree in self.trees for folder in self.tree_folders(tree)]:
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        # Subfolders of a tree are scanned themselves, their mtimes would only echo it
+                        if self.relevant(folder, entry.name) and not (self.in_tree(folder) and entry.is_dir()):
+                            state[entry.path] = entry.stat().st_mtime_ns
+            except OSError:
+                pass
+        return state
+
+    def watch_polling(self) -> None:
+        """Poll modification times until stopped."""
+        previous = self.snapshot()
+        while not self.stopped.wait(self.poll_interval):
+            current = self.snapshot()
+            if current != previous:
+                self.mark_changed()
+            previous = current
+
+    def run(self) -> None:
+        """
+        Watch until interrupted (Ctrl+C).
+        """
+        watched = list(self.folders) + [tree for tree in self.trees if os.path.isdir(tree)]
+        if not watched:
+            print("Error: Nothing to watch, VSCode's User and extensions folders were not found.")
+            return
+        worker = threading.Thread(target=self.worker, name="ss-watch-worker", daemon=True)
+        worker.start()
+        print(f"Watching {', '.join(watched)} (debounce {self.debounce:g}s). Press Ctrl+C to stop.")
+        try:
+            if not self.watch_inotify():
+                self.watch_polling()
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            self.stopped.set()
+            worker.join(timeout=5)
@@ -3,4 +3,4 @@
 abs_path="$( cd "$(dirname "$0")" ; pwd -P )/main.py"
 
 
-python3 $abs_path $@
\ No newline at end of file
+exec python3 "$abs_path" "$@"
\ No newline at end of file
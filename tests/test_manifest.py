@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from modules.manifest import Manifest
+
+
+FIELDS = ("publisher", "name", "version", "description", "repository", "categories")
+
+MANIFESTS = {
+    "plain": {"publisher": "ms-python", "name": "python", "version": "2024.2.1", "categories": ["Languages"]},
+    "large contributes first": {
+        "contributes": {"commands": [{"command": f"ext.cmd{i}", "title": "{[\"]}" * 3, "when": None} for i in range(2000)]},
+        "name": "big", "version": "1.0.0", "publisher": "pub",
+    },
+    "deep nesting": {"a": [[[[{"b": [{"c": {"d": [1, 2, {"e": "}"}]}}]}]]]], "name": "deep", "version": "0.0.1"},
+    "escapes and unicode": {
+        "name": "esc", "description": "quote \" backslash \\ brace } bracket ] é中\U0001f600",
+        "repository": {"type": "git", "url": "https://example.com/\"x\""}, "version": "1.2.3-beta.1",
+    },
+    "primitives": {"private": True, "engines": None, "version": "2.0.0", "count": -1.5e3, "name": "prims"},
+    "missing fields": {"displayName": "Only a display name"},
+    "empty values": {"name": "", "categories": [], "repository": {}, "description": None},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [Manifest.CHUNK_SIZE, 7, 1])
+@pytest.mark.parametrize("label", list(MANIFESTS))
+def test_read_fields_matches_json_load(tmp_path, monkeypatch, label, chunk_size):
+    # Tiny chunks put every token across a buffer refill
+    monkeypatch.setattr(Manifest, "CHUNK_SIZE", chunk_size)
+    path = tmp_path / "package.json"
+    path.write_text(json.dumps(MANIFESTS[label], indent=2, ensure_ascii=False), encoding="utf-8")
+    with open(path, encoding="utf-8") as file:
+        expected = {key: value for key, value in json.load(file).items() if key in FIELDS}
+    assert Manifest.read_fields(str(path), FIELDS) == expected
+
+
+def test_read_fields_compact_json(tmp_path):
+    data = MANIFESTS["large contributes first"]
+    path = tmp_path / "package.json"
+    path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+    assert Manifest.read_fields(str(path), ("name", "version")) == {"name": "big", "version": "1.0.0"}
+
+
+@pytest.mark.parametrize("text", ['{"name": "x", "version": ', '{"name" "x"}', '["name"]', '{"a": [1, 2}'])
+def test_malformed_raises(tmp_path, text):
+    path = tmp_path / "package.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        Manifest.read_fields(str(path), FIELDS)
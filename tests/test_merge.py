@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from modules.merge import Merge
+
+
+def merge(base, local, remote):
+    merged, conflicts = Merge.merge(base, local, remote)
+    # Whatever the edits, the result is still a JSONC object
+    json.loads(Merge.strip(merged))
+    return merged, conflicts
+
+
+def test_remote_change_keeps_local_comments():
+    base = '{\n  "a": 1,\n  "b": 2\n}\n'
+    local = '{\n  // mine\n  "a": 1,\n  "b": 2\n}\n'
+    remote = '{\n  "a": 1,\n  "b": 3\n}\n'
+    assert merge(base, local, remote) == ('{\n  // mine\n  "a": 1,\n  "b": 3\n}\n', [])
+
+
+def test_comment_markers_inside_strings_are_not_comments():
+    base = '{"url": "http://host/*x*/", "a": 1}'
+    local = '{"url": "http://host/*x*/", /* c */ "a": 1}'
+    remote = '{"url": "http://host/*x*/", "a": 2}'
+    assert merge(base, local, remote) == ('{"url": "http://host/*x*/", /* c */ "a": 2}', [])
+
+
+def test_insert_after_trailing_comma_and_comment():
+    base = '{\n  "a": 1,\n}\n'
+    local = '{\n  "a": 1, // note\n}\n'
+    remote = '{\n  "a": 1,\n  "c": [1, 2],\n}\n'
+    assert merge(base, local, remote) == ('{\n  "a": 1, // note\n  "c": [1, 2]\n}\n', [])
+
+
+def test_insert_adds_comma_before_trailing_comment():
+    base = '{\n  "a": 1\n}\n'
+    local = '{\n  "a": 1 // note\n}\n'
+    remote = '{\n  "a": 1,\n  "c": true\n}\n'
+    assert merge(base, local, remote) == ('{\n  "a": 1, // note\n  "c": true\n}\n', [])
+
+
+def test_insert_into_empty_object():
+    assert merge("{}", "{}", '{"x": 1}') == ('{\n    "x": 1\n}', [])
+
+
+def test_insert_keeps_crlf_and_indent():
+    base = '{\r\n    "a": 1\r\n}\r\n'
+    remote = '{\r\n    "a": 1,\r\n    "z": "q"\r\n}\r\n'
+    assert merge(base, base, remote) == ('{\r\n    "a": 1,\r\n    "z": "q"\r\n}\r\n', [])
+
+
+def test_delete_removes_the_whole_line():
+    base = '{\n  "a": 1,\n  "b": 2, // gone\n  "c": 3\n}\n'
+    remote = '{\n  "a": 1,\n  "c": 3\n}\n'
+    assert merge(base, base, remote) == ('{\n  "a": 1,\n  "c": 3\n}\n', [])
+
+
+def test_delete_of_locally_changed_key_is_a_conflict():
+    assert merge('{"a": 1, "b": 2}', '{"a": 1, "b": 5}', '{"a": 1}') == ('{"a": 1, "b": 5}', ["b"])
+
+
+def test_changes_on_both_sides_keep_local_value():
+    assert merge('{"a": 1}', '{"a": 2}', '{"a": 3}') == ('{"a": 2}', ["a"])
+
+
+def test_same_change_on_both_sides_is_not_a_conflict():
+    assert merge('{"a": 1}', '{"a": 2}', '{"a": 2}') == ('{"a": 2}', [])
+
+
+def test_changes_on_different_keys_are_combined():
+    assert merge('{"a": 1, "b": 1}', '{"a": 2, "b": 1}', '{"a": 1, "b": 5}') == ('{"a": 2, "b": 5}', [])
+
+
+def test_formatting_only_differences_are_not_changes():
+    assert merge('{"a": [1,2]}', '{"a": [1, 2]}', '{"a": [ 1 ,2 ]}') == ('{"a": [1, 2]}', [])
+
+
+@pytest.mark.parametrize("text", ["[1, 2]", '{"a": 1} trailing', '{"a" 1}', '{"a": 1 "b": 2}'])
+def test_not_an_object_raises(text):
+    with pytest.raises(ValueError):
+        Merge.merge("{}", text, "{}")
@@ -0,0 +1,51 @@
+import subprocess
+
+import pytest
+
+from modules.metrics import Metrics
+from modules.vscode import VSCode
+from modules.vsix import VSIXCache
+
+
+@pytest.fixture
+def code(tmp_path, monkeypatch):
+    """A fake `code` CLI that fails to install any extension whose ID starts with "bad."."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("shutil.which", lambda name: "code")
+    monkeypatch.setattr(VSIXCache, "fetch", lambda *args, **kwargs: None)
+    monkeypatch.setattr(VSIXCache, "evict", lambda: None)
+    monkeypatch.setattr(Metrics, "counters", {})
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        failed = any(arg.startswith("bad.") for arg in args)
+        return subprocess.CompletedProcess(args, 1 if failed else 0, "", "boom" if failed else "")
+
+    monkeypatch.setattr(subprocess, "run", run)
+    return calls
+
+
+def installs(result):
+    return Metrics.counters.get(Metrics.series("ss_extension_installs_total", {"result": result}), 0)
+
+
+def test_successful_batch_counts_every_extension(code):
+    assert VSCode.install_extensions({"pub.a": "1.0.0", "pub.b": "2.0.0"}) == {}
+    assert len(code) == 1
+    assert (installs("success"), installs("failure")) == (2, 0)
+
+
+def test_failed_batch_counts_each_extension_once(code):
+    failures = VSCode.install_extensions({"pub.a": "1.0.0", "bad.b": "2.0.0", "pub.c": "3.0.0"})
+    assert failures == {"bad.b": "boom"}
+    # The batch, then one process per extension to tell which one failed
+    assert len(code) == 4
+    assert (installs("success"), installs("failure")) == (2, 1)
+
+
+def test_packages_that_cannot_be_fetched_count_as_failures(code):
+    failures = VSCode.install_extensions({"pub.a": "1.0.0", "pub.b": "2.0.0"}, offline=True)
+    assert set(failures) == {"pub.a", "pub.b"}
+    assert code == []
+    assert (installs("success"), installs("failure")) == (0, 2)